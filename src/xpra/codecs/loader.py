@@ -4,150 +4,267 @@
 # Xpra is released under the terms of the GNU GPL v2, or, at your option, any
 # later version. See the file COPYING for details.
 
-from xpra.log import Logger, debug_if_env
+import sys
+from threading import RLock
+
+from xpra.log import Logger, debug_if_env, debug_enabled as logger_debug_enabled
 log = Logger()
 debug = debug_if_env(log, "XPRA_CODEC_DEBUG")
 error = log.error
 warn = log.warn
 
+def debug_enabled():
+    #lets us skip building debug arguments (and calling get_info())
+    #when the messages would be discarded anyway:
+    return logger_debug_enabled(log, debug)
+
+#cache of module_exists results:
+_modules_found = {}
+def module_exists(module_name):
+    """ checks if the module can be found without running its code
+        (only its parent packages are imported) """
+    found = _modules_found.get(module_name)
+    if found is None:
+        try:
+            import pkgutil
+            found = pkgutil.find_loader(module_name) is not None
+        except Exception as e:
+            #missing parent package, or one that fails to load:
+            debug(" cannot find %s: %s", module_name, e)
+            found = False
+        _modules_found[module_name] = found
+    return found
+
 codecs = {}
-def codec_import_check(name, description, top_module, class_module, *classnames):
-    debug("codec_import_check%s", (name, description, top_module, class_module, classnames))
+def codec_import_check(name, description, class_module, *classnames):
+    if debug_enabled():
+        debug("codec_import_check%s", (name, description, class_module, classnames))
+    if not module_exists(class_module):
+        debug(" cannot find %s (%s) in %s", name, description, class_module)
+        #the required module does not exist
+        debug(" xpra was probably built with the option: --without-%s", name)
+        return None
     try:
-        try:
-            __import__(top_module, {}, {}, [])
-            debug(" %s found, will check for %s in %s", top_module, classnames, class_module)
-            for classname in classnames:
-                ic =  __import__(class_module, {}, {}, classname)
-                #warn("codec_import_check(%s, ..)=%s" % (name, ic))
-                debug(" found %s : %s", name, ic)
-                codecs[name] = ic
-                return ic
-        except ImportError, e:
+        #(this also imports the parent packages)
+        ic = __import__(class_module, {}, {}, list(classnames))
+    except ImportError as e:
+        if str(e).startswith("No module named"):
+            #python2's equivalent of ModuleNotFoundError:
+            #a dependency of this codec is not installed (ie: pyopencl)
             debug(" cannot import %s (%s): %s", name, description, e)
-            #the required module does not exist
-            debug(" xpra was probably built with the option: --without-%s", name)
-    except Exception, e:
-        warn("cannot load %s (%s): %s missing from %s: %s", name, description, classname, class_module, e)
-    return None
+        else:
+            #the module is there but cannot be loaded (ie: missing symbols in the shared library)
+            warn("cannot import %s (%s): %s", name, description, e)
+        return None
+    except Exception as e:
+        warn("cannot load %s (%s) from %s: %s", name, description, class_module, e)
+        return None
+    for classname in classnames:
+        if not hasattr(ic, classname):
+            warn("cannot load %s (%s): %s missing from %s", name, description, classname, class_module)
+            return None
+    debug(" found %s : %s", name, ic)
+    codecs[name] = ic
+    return ic
 codec_versions = {}
-def add_codec_version(name, top_module, version="get_version()"):
+_NOT_FOUND = object()
+def add_codec_version(name, top_module, version="get_version()", module=None):
+    #the caller can pass the module if it has already imported it
     try:
         fieldname = version
         if version.endswith("()"):
             fieldname = version[:-2]
-        module = __import__(top_module, {}, {}, [fieldname])
-        if not hasattr(module, fieldname):
+        if module is None:
+            module = __import__(top_module, {}, {}, [fieldname])
+        v = getattr(module, fieldname, _NOT_FOUND)
+        if v is _NOT_FOUND:
             warn("cannot find %s in %s", fieldname, module)
             return
-        v = getattr(module, fieldname)
         if version.endswith("()") and v:
             v = v()
-        global codec_versions
         codec_versions[name] = v
         #optional info:
-        if hasattr(module, "get_info"):
-            info = getattr(module, "get_info")
+        info = getattr(module, "get_info", None)
+        if info is not None and debug_enabled():
             debug("info(%s)=%s", top_module, info())
-    except ImportError, e:
+    except ImportError as e:
         debug("cannot import %s: %s", name, e)
         #not present
         pass
-    except Exception, e:
+    except Exception as e:
         warn("error during codec import: %s", e)
 
 
-loaded = False
-def load_codecs():
-    global loaded
-    if loaded:
-        return
-    loaded = True
-    debug("loading codecs")
-    codec_import_check("PIL", "Python Imaging Library", "PIL", "PIL", "Image")
-    add_codec_version("PIL", "PIL.Image", "VERSION")
+#the webp wrappers need bytearray (python 2.6 or later):
+try:
+    HAS_BYTEARRAY = bytearray is not None
+except NameError:
+    HAS_BYTEARRAY = False
 
-    codec_import_check("enc_vpx", "vpx encoder", "xpra.codecs.vpx", "xpra.codecs.vpx.encoder", "Encoder")
-    codec_import_check("dec_vpx", "vpx decoder", "xpra.codecs.vpx", "xpra.codecs.vpx.decoder", "Decoder")
-    add_codec_version("vpx", "xpra.codecs.vpx.encoder")
+def _check_bytearray(module):
+    return HAS_BYTEARRAY
 
-    codec_import_check("enc_x264", "x264 encoder", "xpra.codecs.enc_x264", "xpra.codecs.enc_x264.encoder", "Encoder")
-    add_codec_version("x264", "xpra.codecs.enc_x264.encoder")
+def _require_webp_handlers(module):
+    #we need the handlers to encode:
+    if not HAS_BYTEARRAY:
+        return False
+    load_codec("webp_bitmap_handlers")
+    return "webp_bitmap_handlers" in codecs
 
-    codec_import_check("enc_nvenc", "nvenc encoder", "xpra.codecs.nvenc", "xpra.codecs.nvenc.encoder", "Encoder")
-    add_codec_version("nvenc", "xpra.codecs.nvenc.encoder")
+def _check_webp_lossless(module):
+    #the fact that the python functions are defined is not enough
+    #we need to check if the underlying C functions actually exist:
+    return bool(module.HAS_LOSSLESS) and _require_webp_handlers(module)
 
-    codec_import_check("csc_swscale", "swscale colorspace conversion", "xpra.codecs.csc_swscale", "xpra.codecs.csc_swscale.colorspace_converter", "ColorspaceConverter")
-    add_codec_version("swscale", "xpra.codecs.csc_swscale.colorspace_converter")
+#checks to run once a codec has been imported,
+#the codec is removed if the check returns False:
+_POST_HOOKS = {
+    "enc_webp"              : _require_webp_handlers,
+    "enc_webp_lossless"     : _check_webp_lossless,
+    "webp_bitmap_handlers"  : _check_bytearray,
+    "dec_webp"              : _check_bytearray,
+    }
 
-    codec_import_check("csc_cython", "cython colorspace conversion", "xpra.codecs.csc_cython", "xpra.codecs.csc_cython.colorspace_converter", "ColorspaceConverter")
-    add_codec_version("cython", "xpra.codecs.csc_cython.colorspace_converter")
+#all the codecs we know about, in the order we list them,
+#each row is: codec name, codec_import_check arguments, add_codec_version arguments (or None)
+CODEC_REGISTRY = (
+    ("PIL",             ("Python Imaging Library", "PIL", "Image"),
+                        ("PIL", "PIL.Image", "VERSION")),
+    ("enc_vpx",         ("vpx encoder", "xpra.codecs.vpx.encoder", "Encoder"),
+                        ("vpx", "xpra.codecs.vpx.encoder")),
+    ("dec_vpx",         ("vpx decoder", "xpra.codecs.vpx.decoder", "Decoder"),
+                        ("vpx", "xpra.codecs.vpx.encoder")),
+    ("enc_x264",        ("x264 encoder", "xpra.codecs.enc_x264.encoder", "Encoder"),
+                        ("x264", "xpra.codecs.enc_x264.encoder")),
+    ("enc_nvenc",       ("nvenc encoder", "xpra.codecs.nvenc.encoder", "Encoder"),
+                        ("nvenc", "xpra.codecs.nvenc.encoder")),
+    ("csc_swscale",     ("swscale colorspace conversion", "xpra.codecs.csc_swscale.colorspace_converter", "ColorspaceConverter"),
+                        ("swscale", "xpra.codecs.csc_swscale.colorspace_converter")),
+    ("csc_cython",      ("cython colorspace conversion", "xpra.codecs.csc_cython.colorspace_converter", "ColorspaceConverter"),
+                        ("cython", "xpra.codecs.csc_cython.colorspace_converter")),
+    ("csc_opencl",      ("OpenCL colorspace conversion", "xpra.codecs.csc_opencl.colorspace_converter", "ColorspaceConverter"),
+                        ("opencl", "xpra.codecs.csc_opencl.colorspace_converter")),
+    ("csc_nvcuda",      ("CUDA colorspace conversion", "xpra.codecs.csc_nvcuda.colorspace_converter", "ColorspaceConverter"),
+                        ("nvcuda", "xpra.codecs.csc_nvcuda.colorspace_converter")),
+    #ffmpeg v1:
+    ("dec_avcodec",     ("avcodec decoder", "xpra.codecs.dec_avcodec.decoder", "Decoder"),
+                        ("avcodec", "xpra.codecs.dec_avcodec.decoder")),
+    #ffmpeg v2:
+    ("dec_avcodec2",    ("avcodec2 decoder", "xpra.codecs.dec_avcodec2.decoder", "Decoder"),
+                        ("avcodec2", "xpra.codecs.dec_avcodec2.decoder")),
+    #these symbols are all available upstream as of libwebp 0.2:
+    ("enc_webp",        ("webp encoder", "xpra.codecs.webm.encode", "EncodeRGB", "EncodeRGBA", "EncodeBGR", "EncodeBGRA"),
+                        ("webp", "xpra.codecs.webm", "__VERSION__")),
+    #these symbols were added in libwebp 0.4, and we added HAS_LOSSLESS to the wrapper:
+    ("enc_webp_lossless", ("webp encoder", "xpra.codecs.webm.encode", "HAS_LOSSLESS", "EncodeLosslessRGB", "EncodeLosslessRGBA", "EncodeLosslessBGRA", "EncodeLosslessBGR"),
+                        None),
+    ("webp_bitmap_handlers", ("webp bitmap handler", "xpra.codecs.webm.handlers", "BitmapHandler"),
+                        None),
+    ("dec_webp",        ("webp decoder", "xpra.codecs.webm.decode", "DecodeRGB", "DecodeRGBA", "DecodeBGR", "DecodeBGRA"),
+                        None),
+    )
 
-    codec_import_check("csc_opencl", "OpenCL colorspace conversion", "xpra.codecs.csc_opencl", "xpra.codecs.csc_opencl.colorspace_converter", "ColorspaceConverter")
-    add_codec_version("opencl", "xpra.codecs.csc_opencl.colorspace_converter")
+ALL_CODECS = tuple(row[0] for row in CODEC_REGISTRY)
+_ALL_CODECS_SET = frozenset(ALL_CODECS)
+#codec name to its registry row:
+CODEC_SPECS = dict((row[0], row) for row in CODEC_REGISTRY)
 
-    codec_import_check("csc_nvcuda", "CUDA colorspace conversion", "xpra.codecs.csc_nvcuda", "xpra.codecs.csc_nvcuda.colorspace_converter", "ColorspaceConverter")
-    add_codec_version("nvcuda", "xpra.codecs.csc_nvcuda.colorspace_converter")
+#the codecs we have already tried to load:
+loaded_codecs = set()
+#codecs can be requested from any thread (ie: the encode thread),
+#so loading must not let another thread see a codec which is only half loaded.
+#(re-entrant since the post import hooks can load other codecs)
+_load_lock = RLock()
+def load_codec(name):
+    with _load_lock:
+        if name in loaded_codecs:
+            return
+        spec = CODEC_SPECS.get(name)
+        if spec is None:
+            return
+        _, import_args, version_args = spec
+        loaded_codecs.add(name)
+        module = codec_import_check(name, *import_args)
+        hook = _POST_HOOKS.get(name)
+        if module and hook and not hook(module):
+            debug(" %s failed the post import check", name)
+            del codecs[name]
+            module = None
+        if module and version_args:
+            vmodule = _get_version_module(module, import_args[1], version_args[1])
+            add_codec_version(*version_args, **{"module" : vmodule})
 
-    #ffmpeg v1:
-    codec_import_check("dec_avcodec", "avcodec decoder", "xpra.codecs.dec_avcodec", "xpra.codecs.dec_avcodec.decoder", "Decoder")
-    add_codec_version("avcodec", "xpra.codecs.dec_avcodec.decoder")
+def _get_version_module(module, class_module, top_module):
+    #avoid importing the module holding the version again
+    #when we already have it (or it is already loaded):
+    if top_module==class_module:
+        return module
+    prefix = class_module+"."
+    if top_module.startswith(prefix):
+        #ie: "PIL.Image" is the "Image" attribute of "PIL"
+        return getattr(module, top_module[len(prefix):], None)
+    #ie: the parent package "xpra.codecs.webm",
+    #if this returns None, add_codec_version will import it:
+    return sys.modules.get(top_module)
 
-    #ffmpeg v2:
-    codec_import_check("dec_avcodec2", "avcodec2 decoder", "xpra.codecs.dec_avcodec2", "xpra.codecs.dec_avcodec2.decoder", "Decoder")
-    add_codec_version("avcodec2", "xpra.codecs.dec_avcodec2.decoder")
-
-    import __builtin__
-    if "bytearray" in __builtin__.__dict__:
-        def nowebp(remove=["enc_webp", "enc_webp_lossless"]):
-            for x in remove:
-                if x in codecs:
-                    del codecs[x]
-        #no bytearray (python 2.6 or later), no webp
-        try:
-            #these symbols are all available upstream as of libwebp 0.2:
-            codec_import_check("enc_webp", "webp encoder", "xpra.codecs.webm", "xpra.codecs.webm.encode", "EncodeRGB", "EncodeRGBA", "EncodeBGR", "EncodeBGRA")
-            codec_import_check("dec_webp", "webp encoder", "xpra.codecs.webm", "xpra.codecs.webm.decode", "DecodeRGB", "DecodeRGBA", "DecodeBGR", "DecodeBGRA")
-            #these symbols were added in libwebp 0.4, and we added HAS_LOSSLESS to the wrapper:
-            _enc_webp_lossless = codec_import_check("enc_webp_lossless", "webp encoder", "xpra.codecs.webm", "xpra.codecs.webm.encode", "HAS_LOSSLESS", "EncodeLosslessRGB", "EncodeLosslessRGBA", "EncodeLosslessBGRA", "EncodeLosslessBGR")
-            if _enc_webp_lossless:
-                #the fact that the python functions are defined is not enough
-                #we need to check if the underlying C functions actually exist:
-                if not _enc_webp_lossless.HAS_LOSSLESS:
-                    nowebp(["enc_webp_lossless"])
-            add_codec_version("webp", "xpra.codecs.webm", "__VERSION__")
-            webp_handlers = codec_import_check("webp_bitmap_handlers", "webp bitmap handler", "xpra.codecs.webm", "xpra.codecs.webm.handlers", "BitmapHandler")
-            #we need the handlers to encode:
-            if not webp_handlers:
-                nowebp()
-        except Exception, e:
-            warn("cannot load webp: " % e)
-            nowebp()
+#the codec status lines, the format does the padding:
+_CODEC_LINE = "* %-20s : %-10s %s"
+_VERSION_LINE = "* %-20s : %s"
+
+def load_codecs():
+    #only load what we haven't tried to load yet:
+    missing = [name for name in ALL_CODECS if name not in loaded_codecs]
+    if not missing:
+        return
+    if not debug_enabled():
+        for name in missing:
+            load_codec(name)
+        return
+    debug("loading codecs: %s", missing)
+    for name in missing:
+        load_codec(name)
     debug("done loading codecs")
     debug("found:")
     #print("codec_status=%s" % codecs)
     for name in ALL_CODECS:
-        debug("* %s : %s %s" % (name.ljust(20), str(name in codecs).ljust(10), codecs.get(name, "")))
+        debug(_CODEC_LINE % (name, name in codecs, codecs.get(name, "")))
     debug("codecs versions:")
     for name, version in codec_versions.items():
-        debug("* %s : %s" % (name.ljust(20), version))
+        debug(_VERSION_LINE % (name, version))
+
+def get_codec_versions():
+    #the versions are only known once the codecs have been loaded,
+    #and the ones we send to the peer must not depend on what was queried so far:
+    load_codecs()
+    return codec_versions
 
 
+#the result of get_codec for each name we have been asked about,
+#including the codecs which are not available:
+_resolved = {}
+_UNRESOLVED = object()
 def get_codec(name):
-    load_codecs()
-    return codecs.get(name)
+    codec = _resolved.get(name, _UNRESOLVED)
+    if codec is _UNRESOLVED:
+        if name not in _ALL_CODECS_SET:
+            #unknown name (ie: from the command line or a config file),
+            #don't let those grow the cache:
+            return None
+        with _load_lock:
+            load_codec(name)
+            codec = codecs.get(name)
+            #only cache the result once the codec is fully loaded:
+            _resolved[name] = codec
+    return codec
 
 def has_codec(name):
-    load_codecs()
-    return name in codecs
+    return get_codec(name) is not None
 
 OLD_ENCODING_NAMES_TO_NEW = {"x264" : "h264", "vpx" : "vp8"}
 NEW_ENCODING_NAMES_TO_OLD = {"h264" : "x264", "vp8" : "vpx"}
 ALL_OLD_ENCODING_NAMES_TO_NEW = {"x264" : "h264", "vpx" : "vp8", "rgb24" : "rgb"}
 ALL_NEW_ENCODING_NAMES_TO_OLD = {"h264" : "x264", "vp8" : "vpx", "rgb" : "rgb24"}
 
-ALL_CODECS = "PIL", "enc_vpx", "dec_vpx", "enc_x264", "enc_nvenc", "csc_swscale", "csc_cython", "csc_opencl", "csc_nvcuda", "dec_avcodec", "dec_avcodec2", "enc_webp", "enc_webp_lossless", "webp_bitmap_handlers", "dec_webp"
-
 #note: this is just for defining the order of encodings,
 #so we have both core encodings (rgb24/rgb32) and regular encodings (rgb) in here:
 PREFERED_ENCODING_ORDER = ["h264", "vp8", "png", "png/P", "png/L", "rgb", "rgb24", "rgb32", "jpeg", "vp9", "webp"]
@@ -160,44 +277,33 @@ try:
 except:
     pass
 
-ENCODINGS_TO_NAME = {
-      "h264"    : "H.264",
-      "vp8"     : "VP8",
-      "vp9"     : "VP9",
-      "png"     : "PNG (24/32bpp)",
-      "png/P"   : "PNG (8bpp colour)",
-      "png/L"   : "PNG (8bpp grayscale)",
-      "webp"    : "WebP",
-      "jpeg"    : "JPEG",
-      "rgb"     : "Raw RGB + %s (24/32bpp)" % ("/".join(compressors)),
-    }
-
-ENCODINGS_HELP = {
-      "h264"    : "H.264 video codec",
-      "vp8"     : "VP8 video codec",
-      "vp9"     : "VP9 video codec (very slow - do not use!)",
-      "png"     : "Portable Network Graphics (lossless, 24bpp or 32bpp for transparency)",
-      "png/P"   : "Portable Network Graphics (lossy, 8bpp colour)",
-      "png/L"   : "Portable Network Graphics (lossy, 8bpp grayscale)",
-      "webp"    : "WebP compression (lossless or lossy) - leaks memory, do not use!",
-      "jpeg"    : "JPEG lossy compression",
-      "rgb"     : "Raw RGB pixels, lossless, compressed using %s (24bpp or 32bpp for transparency)" % (" or ".join(compressors)),
-      }
-
-HELP_ORDER = ("h264", "vp8", "vp9", "png", "png/P", "png/L", "rgb", "jpeg", "webp")
+#for each encoding, in help order: name, user friendly name, help text
+ENCODINGS_INFO = (
+      ("h264",  "H.264",                "H.264 video codec"),
+      ("vp8",   "VP8",                  "VP8 video codec"),
+      ("vp9",   "VP9",                  "VP9 video codec (very slow - do not use!)"),
+      ("png",   "PNG (24/32bpp)",       "Portable Network Graphics (lossless, 24bpp or 32bpp for transparency)"),
+      ("png/P", "PNG (8bpp colour)",    "Portable Network Graphics (lossy, 8bpp colour)"),
+      ("png/L", "PNG (8bpp grayscale)", "Portable Network Graphics (lossy, 8bpp grayscale)"),
+      ("rgb",   "Raw RGB + %s (24/32bpp)" % ("/".join(compressors)),
+                                        "Raw RGB pixels, lossless, compressed using %s (24bpp or 32bpp for transparency)" % (" or ".join(compressors))),
+      ("jpeg",  "JPEG",                 "JPEG lossy compression"),
+      ("webp",  "WebP",                 "WebP compression (lossless or lossy) - leaks memory, do not use!"),
+      )
+ENCODINGS_TO_NAME = dict((e, name) for e, name, _ in ENCODINGS_INFO)
+ENCODINGS_HELP = dict((e, ehelp) for e, _, ehelp in ENCODINGS_INFO)
+HELP_ORDER = tuple(e for e, _, _ in ENCODINGS_INFO)
+#the help lines, with the encoding name already padded:
+_HELP_LINES = tuple((e, e.ljust(12) + ehelp) for e, _, ehelp in ENCODINGS_INFO)
 
 def encodings_help(encodings):
-    h = []
-    for e in HELP_ORDER:
-        if e in encodings:
-            ehelp = ENCODINGS_HELP.get(e)
-            h.append(e.ljust(12) + ehelp)
-    return h
+    if not isinstance(encodings, (set, frozenset)):
+        encodings = frozenset(encodings)
+    return [line for e, line in _HELP_LINES if e in encodings]
 
 
 def main():
     global debug
-    import sys
     import logging
     logging.basicConfig(format="%(message)s")
     logging.root.setLevel(logging.INFO)
@@ -208,11 +314,11 @@ def main():
     print("codecs/csc modules found:")
     #print("codec_status=%s" % codecs)
     for name in ALL_CODECS:
-        print("* %s : %s %s" % (name.ljust(20), str(name in codecs).ljust(10), codecs.get(name, "")))
+        print(_CODEC_LINE % (name, name in codecs, codecs.get(name, "")))
     print("")
     print("codecs versions:")
     for name, version in codec_versions.items():
-        print("* %s : %s" % (name.ljust(20), version))
+        print(_VERSION_LINE % (name, version))
 
     if sys.platform.startswith("win"):
         print("\nPress Enter to close")
@@ -15,6 +15,18 @@ no_arg_signal = n_arg_signal(0)
 one_arg_signal = n_arg_signal(1)
 
 
+#(class, method prefix, property name) -> accessor method or None
+_accessors = {}
+def _get_accessor(cls, prefix, name):
+    key = (cls, prefix, name)
+    try:
+        return _accessors[key]
+    except KeyError:
+        accessor = getattr(cls, prefix + name.replace("-", "_"), None)
+        _accessors[key] = accessor
+        return accessor
+
+
 class AutoPropGObjectMixin(object):
     """Mixin for automagic property support in GObjects.
 
@@ -25,9 +37,9 @@ class AutoPropGObjectMixin(object):
         self._gproperties = {}
 
     def do_get_property(self, pspec):
-        getter = "do_get_property_" + pspec.name.replace("-", "_")
-        if hasattr(self, getter):
-            return getattr(self, getter)(pspec.name)
+        getter = _get_accessor(type(self), "do_get_property_", pspec.name)
+        if getter is not None:
+            return getter(self, pspec.name)
         return self._gproperties.get(pspec.name)
 
     def do_set_property(self, pspec, value):
@@ -36,10 +48,12 @@ class AutoPropGObjectMixin(object):
     # Exposed for subclasses that wish to set readonly properties --
     # .set_property (the public api) will fail, but the property can still be
     # modified via this method.
+    # The accessor methods are looked up once per class and property name,
+    # rather than building the method name and probing for it on every call.
     def _internal_set_property(self, name, value):
-        setter = "do_set_property_" + name.replace("-", "_")
-        if hasattr(self, setter):
-            getattr(self, setter)(name, value)
+        setter = _get_accessor(type(self), "do_set_property_", name)
+        if setter is not None:
+            setter(self, name, value)
         else:
             self._gproperties[name] = value
         self.notify(name)
@@ -29,6 +29,10 @@ class Logger(object):
             kwargs["exc_info"] = sys.exc_info()
         self.logger.log(level, msg, *args, **kwargs)
 
+    def is_debug_enabled(self):
+        #allows callers to skip building expensive log arguments:
+        return self.logger.isEnabledFor(logging.DEBUG)
+
     def _method_maker(level):           #@NoSelf
         return (lambda self, msg, *args, **kwargs:
                 self.log(level, msg, *args, **kwargs))
@@ -48,3 +52,8 @@ def debug_if_env(log, env_name):
         return log.info
     else:
         return log.debug
+
+#tells us if a logging function returned by debug_if_env will output anything,
+#so callers can skip building expensive arguments when it won't:
+def debug_enabled(log, debug):
+    return debug!=log.debug or log.is_debug_enabled()
@@ -10,10 +10,17 @@
 import win32api                    #@UnresolvedImport
 import win32gui                    #@UnresolvedImport
 import win32con                    #@UnresolvedImport
+import win32event                  #@UnresolvedImport
 
 import sys, os
+from collections import deque
+from ctypes import windll, Structure, WINFUNCTYPE, sizeof, byref, addressof, memmove, memset, c_wchar, c_int, c_ssize_t
+from ctypes.wintypes import DWORD, HWND, UINT, HICON, WCHAR, WPARAM, LPARAM, HINSTANCE, HANDLE, HBRUSH, LPCWSTR, ATOM
 
-from xpra.log import Logger, debug_if_env
+if sys.version > '3':
+    unicode = str           #@ReservedAssignment
+
+from xpra.log import Logger, debug_if_env, debug_enabled
 log = Logger()
 debug = debug_if_env(log, "XPRA_TRAY_DEBUG")
 
@@ -37,56 +44,121 @@ BUTTON_MAP = {
             WM_XBUTTONUP                : [(4, 0)],
             WM_XBUTTONDBLCLK            : [(4, 1), (4, 0)],
             }
+#the button messages are all in the range WM_LBUTTONDOWN - WM_XBUTTONDBLCLK,
+#so we can decode them by indexing into a table rather than with a dict lookup,
+#the (button, pressed) tuples are used as the callback arguments as they are:
+BUTTON_BASE = win32con.WM_LBUTTONDOWN
+BUTTON_EVENTS = tuple(BUTTON_MAP.get(x) for x in range(BUTTON_BASE, WM_XBUTTONDBLCLK+1))
+BUTTON_EVENTS_COUNT = len(BUTTON_EVENTS)
 
 FALLBACK_ICON = win32gui.LoadIcon(0, win32con.IDI_APPLICATION)
 
+#bound once here rather than looked up on every call:
+NIM_ADD     = win32gui.NIM_ADD
+NIM_MODIFY  = win32gui.NIM_MODIFY
+NIM_DELETE  = win32gui.NIM_DELETE
+NIF_ICON    = win32gui.NIF_ICON
+NIF_ALL     = win32gui.NIF_ICON | win32gui.NIF_MESSAGE | win32gui.NIF_TIP
+
+
+#we call the unicode version of Shell_NotifyIcon directly,
+#using a structure which we keep around and update in place:
+Shell_NotifyIconW = windll.shell32.Shell_NotifyIconW
+class NOTIFYICONDATAW(Structure):
+    #http://msdn.microsoft.com/en-us/library/windows/desktop/bb773352(v=vs.85).aspx
+    #(v2 layout, as supported by XP and later)
+    _fields_ = [
+        ("cbSize",              DWORD),
+        ("hWnd",                HWND),
+        ("uID",                 UINT),
+        ("uFlags",              UINT),
+        ("uCallbackMessage",    UINT),
+        ("hIcon",               HICON),
+        ("szTip",               WCHAR * 128),
+        ("dwState",             DWORD),
+        ("dwStateMask",         DWORD),
+        ("szInfo",              WCHAR * 256),
+        ("uTimeoutOrVersion",   UINT),
+        ("szInfoTitle",         WCHAR * 64),
+        ("dwInfoFlags",         DWORD),
+        ]
+SZTIP_OFFSET = NOTIFYICONDATAW.szTip.offset
+SZTIP_MAX = 127
+WCHAR_SIZE = sizeof(c_wchar)
+
 
 class win32NotifyIcon(object):
 
-    click_callbacks = {}
-    exit_callbacks = {}
-    command_callbacks = {}
-    live_hwnds = set()
+    __slots__ = ("hwnd", "hinst", "nid", "current_icon", "click_callback", "exit_callback", "command_callback")
+
+    #hwnd -> win32NotifyIcon instance, used for dispatching window messages:
+    instances = {}
+    #(iconPathName, hinst) -> icon handle:
+    icon_cache = {}
+    #one slot cache in front of the instances dict,
+    #as messages tend to arrive in bursts for the same window:
+    last_hwnd = 0
+    last_inst = None
+    #callbacks are not run from the window procedure,
+    #they are queued here and run by drain_tray_events():
+    event_queue = deque()
 
     def __init__(self, title, click_callback, exit_callback, command_callback=None, iconPathName=None):
-        self.title = title[:127]
         self.current_icon = None
-        # Register the Window class.
+        self.click_callback = click_callback
+        self.exit_callback = exit_callback
+        self.command_callback = command_callback
+        # Register the Window class (first instance only).
         self.hinst = NIwc.hInstance
+        class_atom = acquire_window_class()
         # Create the Window.
         style = win32con.WS_OVERLAPPED | win32con.WS_SYSMENU
-        self.hwnd = win32gui.CreateWindow(NIclassAtom, self.title+" StatusIcon Window", style, \
+        self.hwnd = win32gui.CreateWindow(class_atom, title[:SZTIP_MAX]+" StatusIcon Window", style, \
             0, 0, win32con.CW_USEDEFAULT, win32con.CW_USEDEFAULT, \
             0, 0, self.hinst, None)
-        win32gui.UpdateWindow(self.hwnd)
         self.current_icon = self.LoadImage(iconPathName)
-        win32gui.Shell_NotifyIcon(win32gui.NIM_ADD, self.make_nid(win32gui.NIF_ICON | win32gui.NIF_MESSAGE | win32gui.NIF_TIP))
-        #register callbacks:
-        win32NotifyIcon.live_hwnds.add(self.hwnd)
-        win32NotifyIcon.click_callbacks[self.hwnd] = click_callback
-        win32NotifyIcon.exit_callbacks[self.hwnd] = exit_callback
-        win32NotifyIcon.command_callbacks[self.hwnd] = command_callback
-
-    def make_nid(self, flags):
-        return (self.hwnd, 0, flags, WM_TRAY_EVENT, self.current_icon, self.title)
+        self.nid = NOTIFYICONDATAW()
+        self.nid.cbSize = sizeof(NOTIFYICONDATAW)
+        self.nid.hWnd = self.hwnd
+        self.nid.uID = 0
+        self.nid.uCallbackMessage = WM_TRAY_EVENT
+        self.nid.hIcon = self.current_icon
+        self.set_tip(title)
+        self.shell_notify(NIM_ADD, NIF_ALL)
+        #register for callbacks:
+        win32NotifyIcon.instances[self.hwnd] = self
+
+    def set_tip(self, text):
+        #copy the text straight into the structure's buffer,
+        #truncating it if needed and always null terminating it:
+        if not isinstance(text, unicode):
+            text = text.decode("utf8", "replace")
+        l = min(len(text), SZTIP_MAX)
+        addr = addressof(self.nid)+SZTIP_OFFSET
+        memmove(addr, text, l*WCHAR_SIZE)
+        memset(addr+l*WCHAR_SIZE, 0, WCHAR_SIZE)
+
+    def shell_notify(self, message, flags):
+        self.nid.uFlags = flags
+        return Shell_NotifyIconW(message, byref(self.nid))
 
     def set_blinking(self, on):
         #FIXME: implement blinking on win32 using a timer
         pass
 
     def set_tooltip(self, name):
-        self.title = name[:127]
-        win32gui.Shell_NotifyIcon(win32gui.NIM_MODIFY, self.make_nid(win32gui.NIF_ICON | win32gui.NIF_MESSAGE | win32gui.NIF_TIP))
+        self.set_tip(name)
+        self.shell_notify(NIM_MODIFY, NIF_ALL)
 
     def set_icon(self, iconPathName):
         hicon = self.LoadImage(iconPathName)
         self.do_set_icon(hicon)
-        win32gui.Shell_NotifyIcon(win32gui.NIM_MODIFY, self.make_nid(win32gui.NIF_ICON))
 
     def do_set_icon(self, hicon):
         debug("do_set_icon(%s)", hicon)
         self.current_icon = hicon
-        win32gui.Shell_NotifyIcon(win32gui.NIM_MODIFY, self.make_nid(win32gui.NIF_ICON))
+        self.nid.hIcon = hicon
+        self.shell_notify(NIM_MODIFY, NIF_ICON)
 
 
     def set_icon_from_data(self, pixels, has_alpha, w, h, rowstride):
@@ -148,7 +220,6 @@ class win32NotifyIcon(object):
                 if hicon==0:
                     hicon = FALLBACK_ICON
             self.do_set_icon(hicon)
-            win32gui.UpdateWindow(self.hwnd)
         except:
             log.error("error setting icon", exc_info=True)
         finally:
@@ -158,6 +229,15 @@ class win32NotifyIcon(object):
 
 
     def LoadImage(self, iconPathName, fallback=FALLBACK_ICON):
+        key = (iconPathName, self.hinst)
+        v = win32NotifyIcon.icon_cache.get(key)
+        if v is not None:
+            debug("LoadImage(%s)=%s (cached)", iconPathName, v)
+            return v
+        if not iconPathName or not os.path.isfile(iconPathName):
+            log.warn("icon file %s not found, using the default icon", iconPathName)
+            win32NotifyIcon.icon_cache[key] = fallback
+            return fallback
         icon_flags = win32con.LR_LOADFROMFILE | win32con.LR_DEFAULTSIZE
         try:
             img_type = win32con.IMAGE_ICON
@@ -168,63 +248,118 @@ class win32NotifyIcon(object):
                                         {win32con.IMAGE_ICON    : "ICON",
                                          win32con.IMAGE_BITMAP  : "BITMAP"}.get(img_type))
             v = win32gui.LoadImage(self.hinst, iconPathName, img_type, 0, 0, icon_flags)
-        except Exception, e:
+        except Exception as e:
             log.error("Failed to load icon at %s: %s", iconPathName, e)
             v = fallback
+        #also cache failures, so we don't keep trying to load a bad file:
+        win32NotifyIcon.icon_cache[key] = v
         debug("LoadImage(%s)=%s", iconPathName, v)
         return v
 
     @classmethod
-    def restart(cls):
-        #FIXME: keep current icon and repaint it on restart
-        pass
+    def cleanup(cls):
+        debug("win32NotifyIcon.cleanup() icon cache=%s", cls.icon_cache)
+        icons = set(cls.icon_cache.values())
+        cls.icon_cache = {}
+        for hicon in icons:
+            if hicon and hicon!=FALLBACK_ICON:
+                try:
+                    win32gui.DestroyIcon(hicon)
+                except:
+                    log.error("failed to destroy icon %s", hicon, exc_info=True)
 
     @classmethod
-    def remove_callbacks(cls, hwnd):
-        for x in (cls.command_callbacks, cls.exit_callbacks, cls.click_callbacks):
-            if hwnd in x:
-                del x[hwnd]
+    def restart(cls, *args):
+        #FIXME: keep current icon and repaint it on restart
+        pass
 
     @classmethod
     def OnCommand(cls, hwnd, msg, wparam, lparam):
-        cc = cls.command_callbacks.get(hwnd)
-        debug("OnCommand(%s,%s,%s,%s) command callback=%s", hwnd, msg, wparam, lparam, cc)
+        if hwnd==cls.last_hwnd:
+            inst = cls.last_inst
+        else:
+            inst = cls.instances.get(hwnd)
+            if inst is None:
+                return
+            cls.last_hwnd, cls.last_inst = hwnd, inst
+        cc = inst.command_callback
+        if debug_enabled(log, debug):
+            debug("OnCommand(%s,%s,%s,%s) command callback=%s", hwnd, msg, wparam, lparam, cc)
         if cc:
             cid = win32api.LOWORD(wparam)
-            cc(hwnd, cid)
+            cls.queue_event(cc, (hwnd, cid))
 
     @classmethod
     def OnDestroy(cls, hwnd, msg, wparam, lparam):
-        ec = cls.exit_callbacks.get(hwnd)
-        debug("OnDestroy(%s,%s,%s,%s) exit_callback=%s", hwnd, msg, wparam, lparam, ec)
-        if hwnd not in cls.live_hwnds:
+        if hwnd==cls.last_hwnd:
+            cls.last_hwnd, cls.last_inst = 0, None
+        inst = cls.instances.pop(hwnd, None)
+        if inst is None:
+            debug("OnDestroy(%s,%s,%s,%s) unknown window", hwnd, msg, wparam, lparam)
             return
-        cls.live_hwnds.remove(hwnd)
-        cls.remove_callbacks(hwnd)
+        ec = inst.exit_callback
+        debug("OnDestroy(%s,%s,%s,%s) exit_callback=%s", hwnd, msg, wparam, lparam, ec)
         try:
-            nid = (hwnd, 0)
-            debug("OnDestroy(..) calling Shell_NotifyIcon(NIM_DELETE, %s)", nid)
-            win32gui.Shell_NotifyIcon(win32gui.NIM_DELETE, nid)
+            debug("OnDestroy(..) calling Shell_NotifyIconW(NIM_DELETE, %s)", inst.nid)
+            inst.shell_notify(NIM_DELETE, 0)
             debug("OnDestroy(..) calling exit_callback=%s", ec)
             if ec:
                 ec()
         except:
             log.error("OnDestroy(..)", exc_info=True)
+        #the class cannot be unregistered while the window still exists,
+        #so when we get here from WM_DESTROY, release it once the window is gone:
+        if msg is None:
+            release_window_class()
+        else:
+            cls.queue_event(release_window_class, ())
 
     @classmethod
     def OnTaskbarNotify(cls, hwnd, msg, wparam, lparam):
-        bm = BUTTON_MAP.get(lparam)
-        cc = cls.click_callbacks.get(hwnd)
-        debug("OnTaskbarNotify(%s,%s,%s,%s) button(s) lookup: %s, callback=%s", hwnd, msg, wparam, lparam, bm, cc)
+        if hwnd==cls.last_hwnd:
+            inst = cls.last_inst
+        else:
+            inst = cls.instances.get(hwnd)
+            if inst is None:
+                return 1
+            cls.last_hwnd, cls.last_inst = hwnd, inst
+        i = lparam-BUTTON_BASE
+        if 0<=i<BUTTON_EVENTS_COUNT:
+            bm = BUTTON_EVENTS[i]
+        else:
+            bm = None
+        cc = inst.click_callback
+        if debug_enabled(log, debug):
+            debug("OnTaskbarNotify(%s,%s,%s,%s) button(s) lookup: %s, callback=%s", hwnd, msg, wparam, lparam, bm, cc)
         if bm is not None and cc:
             for button_event in bm:
-                cc(*button_event)
+                cls.queue_event(cc, button_event)
         return 1
 
+    @classmethod
+    def queue_event(cls, callback, args):
+        q = cls.event_queue
+        schedule = not q and drain_scheduler
+        q.append((callback, args))
+        if schedule:
+            drain_scheduler(drain_tray_events)
+
     def close(self):
         debug("win32NotifyIcon.close()")
-        win32NotifyIcon.remove_callbacks(self.hwnd)
+        #closing is not the same as the window being destroyed,
+        #so don't fire the exit callback:
+        self.exit_callback = None
+        try:
+            #this runs OnDestroy via WM_DESTROY:
+            win32gui.DestroyWindow(self.hwnd)
+        except Exception as e:
+            #the window may already be gone
+            debug("win32NotifyIcon.close() DestroyWindow(%s) failed: %s", self.hwnd, e)
+        #in case we did not get WM_DESTROY:
         win32NotifyIcon.OnDestroy(self.hwnd, None, None, None)
+        if not win32NotifyIcon.instances:
+            #last one out frees the cached icons:
+            win32NotifyIcon.cleanup()
 
 
 WM_TRAY_EVENT = win32con.WM_USER+20        #a message id we choose
@@ -234,41 +369,184 @@ message_map = {
     win32con.WM_COMMAND                 : win32NotifyIcon.OnCommand,
     WM_TRAY_EVENT                       : win32NotifyIcon.OnTaskbarNotify,
 }
-NIwc = win32gui.WNDCLASS()
-NIwc.hInstance = win32api.GetModuleHandle(None)
-NIwc.lpszClassName = "win32NotifyIcon"
-NIwc.lpfnWndProc = message_map # could also specify a wndproc.
-NIclassAtom = win32gui.RegisterClass(NIwc)
-
-
 
+def make_dispatch_table(handlers):
+    """ find the smallest power of two mask which gives each message id its own slot,
+        so we can dispatch with a simple index (and one comparison to verify the key) """
+    size = 4
+    while len(set(msg & (size-1) for msg in handlers.keys()))<len(handlers):
+        size *= 2
+    mask = size-1
+    keys = [None] * size
+    table = [None] * size
+    for msg, handler in handlers.items():
+        keys[msg & mask] = msg
+        table[msg & mask] = handler
+    return mask, tuple(keys), tuple(table)
+MESSAGE_MASK, MESSAGE_KEYS, MESSAGE_HANDLERS = make_dispatch_table(message_map)
+
+#the window class is registered using ctypes so that windows calls
+#a single static WNDPROC callback, rather than going through pywin32's
+#message map wrapper for every message:
+LRESULT = c_ssize_t
+WNDPROC = WINFUNCTYPE(LRESULT, HWND, UINT, WPARAM, LPARAM)
+class WNDCLASSEXW(Structure):
+    #http://msdn.microsoft.com/en-us/library/windows/desktop/ms633577(v=vs.85).aspx
+    _fields_ = [
+        ("cbSize",              UINT),
+        ("style",               UINT),
+        ("lpfnWndProc",         WNDPROC),
+        ("cbClsExtra",          c_int),
+        ("cbWndExtra",          c_int),
+        ("hInstance",           HINSTANCE),
+        ("hIcon",               HICON),
+        ("hCursor",             HANDLE),
+        ("hbrBackground",       HBRUSH),
+        ("lpszMenuName",        LPCWSTR),
+        ("lpszClassName",       LPCWSTR),
+        ("hIconSm",             HICON),
+        ]
+RegisterClassExW = windll.user32.RegisterClassExW
+RegisterClassExW.restype = ATOM
+UnregisterClassW = windll.user32.UnregisterClassW
+UnregisterClassW.argtypes = [LPCWSTR, HINSTANCE]
+DefWindowProcW = windll.user32.DefWindowProcW
+DefWindowProcW.argtypes = [HWND, UINT, WPARAM, LPARAM]
+DefWindowProcW.restype = LRESULT
+
+def NotifyIconWndProc(hwnd, msg, wparam, lparam):
+    i = msg & MESSAGE_MASK
+    if MESSAGE_KEYS[i]==msg:
+        return MESSAGE_HANDLERS[i](hwnd, msg, wparam, lparam) or 0
+    return DefWindowProcW(hwnd, msg, wparam, lparam)
+#we must keep a reference to the callback for as long as the class is registered:
+NotifyIconWndProc_ptr = WNDPROC(NotifyIconWndProc)
+
+NIwc = WNDCLASSEXW()
+NIwc.cbSize = sizeof(WNDCLASSEXW)
+NIwc.hInstance = win32api.GetModuleHandle(None)
+NIwc.lpszClassName = u"win32NotifyIcon"
+NIwc.lpfnWndProc = NotifyIconWndProc_ptr
+
+#the class is only registered once we create a tray icon,
+#and unregistered again when the last one is closed:
+NIclassAtom = None
+NIclassRefCount = 0
+
+def acquire_window_class():
+    global NIclassAtom, NIclassRefCount
+    if NIclassAtom is None:
+        NIclassAtom = RegisterClassExW(byref(NIwc))
+        debug("RegisterClassExW(%s)=%s", NIwc.lpszClassName, NIclassAtom)
+    NIclassRefCount += 1
+    return NIclassAtom
+
+def release_window_class():
+    global NIclassAtom, NIclassRefCount
+    NIclassRefCount -= 1
+    if NIclassRefCount>0 or NIclassAtom is None:
+        return
+    NIclassRefCount = 0
+    if not UnregisterClassW(NIwc.lpszClassName, NIwc.hInstance):
+        log.warn("failed to unregister window class %s", NIwc.lpszClassName)
+    NIclassAtom = None
+
+
+
+#called with drain_tray_events when events are queued,
+#ie: gobject.idle_add (pump_messages does not need one)
+drain_scheduler = None
+def set_drain_scheduler(scheduler):
+    global drain_scheduler
+    drain_scheduler = scheduler
+
+def drain_tray_events():
+    """ runs the callbacks queued by the window message handlers """
+    q = win32NotifyIcon.event_queue
+    while q:
+        callback, args = q.popleft()
+        try:
+            callback(*args)
+        except:
+            log.error("error in tray callback %s%s", callback, args, exc_info=True)
+    #so this can be used directly with idle_add:
+    return False
+
+
+def pump_messages(timeout=win32event.INFINITE):
+    """ Alternative to win32gui.PumpMessages():
+        drains all the pending messages before blocking again,
+        only dispatches the last of a burst of WM_MOUSEMOVE messages,
+        and runs the queued tray callbacks.
+        Returns when WM_QUIT is received. """
+    MsgWait = win32event.MsgWaitForMultipleObjects
+    PeekMessage = win32gui.PeekMessage
+    TranslateMessage = win32gui.TranslateMessage
+    DispatchMessage = win32gui.DispatchMessage
+    QS_ALLINPUT = win32event.QS_ALLINPUT
+    PM_REMOVE = win32con.PM_REMOVE
+    PM_NOREMOVE = win32con.PM_NOREMOVE
+    WM_QUIT = win32con.WM_QUIT
+    WM_MOUSEMOVE = win32con.WM_MOUSEMOVE
+    while True:
+        #process what is already queued before waiting:
+        while True:
+            rc, msg = PeekMessage(None, 0, 0, PM_REMOVE)
+            if not rc:
+                break
+            if msg[1]==WM_QUIT:
+                debug("pump_messages() WM_QUIT")
+                return
+            if msg[1]==WM_MOUSEMOVE:
+                #only the most recent position matters,
+                #but only skip ahead while the very next message is a move for the same window
+                #so we never re-order it with the button events:
+                while True:
+                    rc, next_msg = PeekMessage(None, 0, 0, PM_NOREMOVE)
+                    if not rc or next_msg[1]!=WM_MOUSEMOVE or next_msg[0]!=msg[0]:
+                        break
+                    rc, next_msg = PeekMessage(msg[0], WM_MOUSEMOVE, WM_MOUSEMOVE, PM_REMOVE)
+                    if not rc:
+                        break
+                    msg = next_msg
+            TranslateMessage(msg)
+            DispatchMessage(msg)
+        drain_tray_events()
+        #wait for something to arrive in the queue:
+        MsgWait([], False, timeout, QS_ALLINPUT)
+
+
+def notify_callback(hwnd, button, pressed):
+    if pressed:
+        return
+    menu = win32gui.CreatePopupMenu()
+    win32gui.AppendMenu( menu, win32con.MF_STRING, 1024, "Generate balloon")
+    win32gui.AppendMenu( menu, win32con.MF_STRING, 1025, "Exit")
+    pos = win32api.GetCursorPos()
+    win32gui.SetForegroundWindow(hwnd)
+    win32gui.TrackPopupMenu(menu, win32con.TPM_LEFTALIGN, pos[0], pos[1], 0, hwnd, None)
+    win32api.PostMessage(hwnd, win32con.WM_NULL, 0, 0)
+
+def command_callback(hwnd, cid):
+    if cid == 1024:
+        from xpra.platform.win32.win32_balloon import notify
+        notify(hwnd, "hello", "world")
+    elif cid == 1025:
+        print("Goodbye")
+        win32gui.DestroyWindow(hwnd)
+    else:
+        print("OnCommand for ID=%s" % cid)
+
+def win32_quit():
+    win32gui.PostQuitMessage(0) # Terminate the app.
 
 def main():
-    def notify_callback(hwnd):
-        menu = win32gui.CreatePopupMenu()
-        win32gui.AppendMenu( menu, win32con.MF_STRING, 1024, "Generate balloon")
-        win32gui.AppendMenu( menu, win32con.MF_STRING, 1025, "Exit")
-        pos = win32api.GetCursorPos()
-        win32gui.SetForegroundWindow(hwnd)
-        win32gui.TrackPopupMenu(menu, win32con.TPM_LEFTALIGN, pos[0], pos[1], 0, hwnd, None)
-        win32api.PostMessage(hwnd, win32con.WM_NULL, 0, 0)
-
-    def command_callback(hwnd, cid):
-        if cid == 1024:
-            from xpra.platform.win32.win32_balloon import notify
-            notify(hwnd, "hello", "world")
-        elif cid == 1025:
-            print("Goodbye")
-            win32gui.DestroyWindow(hwnd)
-        else:
-            print("OnCommand for ID=%s" % cid)
-
-    def win32_quit():
-        win32gui.PostQuitMessage(0) # Terminate the app.
-
+    import functools
     iconPathName = os.path.abspath(os.path.join( sys.prefix, "pyc.ico"))
-    win32NotifyIcon(notify_callback, win32_quit, command_callback, iconPathName)
-    win32gui.PumpMessages()
+    tray = win32NotifyIcon("tray-demo", None, win32_quit, command_callback, iconPathName)
+    #the click callback only receives the button and its state, so bind the hwnd:
+    tray.click_callback = functools.partial(notify_callback, tray.hwnd)
+    pump_messages()
 
 
 if __name__=='__main__':
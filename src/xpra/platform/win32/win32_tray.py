@@ -8,8 +8,9 @@
 # with methods for integrating with win32_balloon and the popup menu
 
 import win32ts, win32con, win32api, win32gui        #@UnresolvedImport
+import gobject
 
-from xpra.platform.win32.win32_NotifyIcon import win32NotifyIcon, WM_TRAY_EVENT, BUTTON_MAP
+from xpra.platform.win32.win32_NotifyIcon import win32NotifyIcon, WM_TRAY_EVENT, BUTTON_MAP, set_drain_scheduler
 from xpra.client.tray_base import TrayBase, log, debug
 
 #had to look this up online:
@@ -50,6 +51,8 @@ class Win32Tray(TrayBase):
         self.default_icon_extension = "ico"
         self.default_icon_name = "xpra.ico"
         icon_filename = self.get_tray_icon_filename(self.default_icon_filename)
+        #run the tray callbacks from the main loop:
+        set_drain_scheduler(gobject.idle_add)
         self.tray_widget = win32NotifyIcon(self.tooltip, self.click_cb, self.exit_cb, None, icon_filename)
         #now let's try to hook the session notification
         self.detect_win32_session_events(self.getHWND())
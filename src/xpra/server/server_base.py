@@ -19,7 +19,7 @@ from xpra.util import log_screen_sizes
 from xpra.os_util import thread, get_hex_uuid
 from xpra.version_util import add_version_info
 from xpra.util import alnum
-from xpra.codecs.loader import PREFERED_ENCODING_ORDER, codec_versions, has_codec, get_codec
+from xpra.codecs.loader import PREFERED_ENCODING_ORDER, get_codec_versions, has_codec, get_codec
 from xpra.codecs.video_helper import getVideoHelper
 
 if sys.version > '3':
@@ -597,7 +597,7 @@ class ServerBase(ServerCore):
              "server_type"                  : "base",
              })
         add_version_info(capabilities)
-        for k,v in codec_versions.items():
+        for k,v in get_codec_versions().items():
             capabilities["encoding.%s.version" % k] = v
         return capabilities
 
@@ -862,7 +862,7 @@ class ServerBase(ServerCore):
             for k,v in self._clipboard_helper.get_info().items():
                 info["clipboard.%s" % k] = v
         info.update(self.get_encoding_info())
-        for k,v in codec_versions.items():
+        for k,v in get_codec_versions().items():
             info["encoding.%s.version" % k] = v
         info["windows"] = len([window for window in list(self._id_to_window.values()) if window.is_managed()])
         info.update({
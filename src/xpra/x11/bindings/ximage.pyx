@@ -360,6 +360,9 @@ cdef class XShmWrapper(object):
         self.width = width
         self.height = height
         self.depth = depth
+        #so cleanup() is safe even if setup() is never called:
+        self.image = NULL
+        self.shminfo.shmaddr = <char *> -1
 
     def setup(self):
         #returns:
@@ -418,6 +421,16 @@ cdef class XShmWrapper(object):
     def get_size(self):                                     #@DuplicatedSignature
         return self.width, self.height
 
+    def get_depth(self):
+        return self.depth
+
+    def get_visualid(self):
+        return self.visual.visualid
+
+    def get_ref_count(self):
+        #the number of XShmImageWrappers still using our shared memory segment
+        return self.ref_count
+
     def get_image(self, xpixmap, x, y, w, h):
         assert self.image!=NULL, "cannot retrieve image wrapper: XImage is NULL!"
         if self.closed:
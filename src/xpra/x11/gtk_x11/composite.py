@@ -4,6 +4,7 @@
 # Xpra is released under the terms of the GNU GPL v2, or, at your option, any
 # later version. See the file COPYING for details.
 
+import os
 import gobject
 from xpra.gtk_common.gobject_util import one_arg_signal, AutoPropGObjectMixin
 from xpra.x11.gtk_x11.gdk_bindings import (
@@ -23,6 +24,52 @@ X11Window.ensure_XDamage_support()
 from xpra.log import Logger
 log = Logger()
 
+#how many unused XShm wrappers we keep around for re-use:
+XSHM_POOL_SIZE = int(os.environ.get("XPRA_XSHM_POOL_SIZE", "2"))
+
+
+class XShmPool(object):
+    """
+        Keeps XShm wrappers that are no longer used by a window
+        (because the window was resized or destroyed),
+        so that another window with the same visual, depth and dimensions can use it
+        without having to create and attach a new shared memory segment.
+        Only wrappers which no longer have any images pointing to their segment
+        are added (see CompositeHelper._release_shm_handle).
+        The wrappers are keyed by (visualid, depth, width, height),
+        the least recently released ones are freed first.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.wrappers = []
+
+    def get(self, key):
+        for i, (k, wrapper) in enumerate(self.wrappers):
+            if k==key:
+                del self.wrappers[i]
+                log("XShmPool.get(%s)=%s", key, wrapper)
+                return wrapper
+        return None
+
+    def put(self, key, wrapper):
+        log("XShmPool.put(%s, %s)", key, wrapper)
+        self.wrappers.append((key, wrapper))
+        while len(self.wrappers)>self.size:
+            _, old = self.wrappers.pop(0)
+            old.cleanup()
+
+    def cleanup(self):
+        wrappers = self.wrappers
+        self.wrappers = []
+        for _, wrapper in wrappers:
+            wrapper.cleanup()
+
+xshm_pool = XShmPool(XSHM_POOL_SIZE)
+
+def shm_key(wrapper):
+    return (wrapper.get_visualid(), wrapper.get_depth())+tuple(wrapper.get_size())
+
 
 class CompositeHelper(AutoPropGObjectMixin, gobject.GObject):
 
@@ -81,9 +128,7 @@ class CompositeHelper(AutoPropGObjectMixin, gobject.GObject):
         if self._damage_handle:
             trap.swallow_synced(X11Window.XDamageDestroy, self._damage_handle)
             self._damage_handle = None
-        if self._shm_handle:
-            self._shm_handle.cleanup()
-            self._shm_handle = None
+        self._release_shm_handle()
         #note: this should be redundant since we cleared the
         #reference to self._window and shortcut out in do_get_property_contents_handle
         #but it's cheap anyway
@@ -112,18 +157,27 @@ class CompositeHelper(AutoPropGObjectMixin, gobject.GObject):
     def do_get_property_shm_handle(self, name):
         if not self._use_shm or not CompositeHelper.XShmEnabled:
             return None
-        if self._shm_handle and self._shm_handle.get_size()!=self._window.get_size():
+        size = self._window.get_size()
+        if self._shm_handle and self._shm_handle.get_size()!=size:
             #size has changed!
-            #make sure the current wrapper gets garbage collected:
-            self._shm_handle.cleanup()
-            self._shm_handle = None
+            #hand the current wrapper back to the pool:
+            self._release_shm_handle()
         if self._shm_handle is None:
-            #make a new one:
-            self._shm_handle = XImage.get_XShmWrapper(get_xwindow(self._window))
-            if self._shm_handle is None:
+            #this does not allocate the shared memory segment yet:
+            shm = XImage.get_XShmWrapper(get_xwindow(self._window))
+            if shm is None:
                 #failed (may retry)
                 return None
-            init_ok, retry_window, xshm_failed = self._shm_handle.setup()
+            #try to re-use one from the pool,
+            #(the wrapper uses the visual and dimensions from the X server)
+            pooled = xshm_pool.get(shm_key(shm))
+            if pooled:
+                shm.cleanup()
+                self._shm_handle = pooled
+                return pooled
+            #make a new one:
+            self._shm_handle = shm
+            init_ok, retry_window, xshm_failed = shm.setup()
             if not init_ok:
                 #this handle is not valid, clear it:
                 self._shm_handle = None
@@ -135,6 +189,17 @@ class CompositeHelper(AutoPropGObjectMixin, gobject.GObject):
                 CompositeHelper.XShmEnabled = False
         return self._shm_handle
 
+    def _release_shm_handle(self):
+        shm = self._shm_handle
+        if shm:
+            self._shm_handle = None
+            #images we have handed out may still be queued for encoding,
+            #another window must not be allowed to overwrite their pixels:
+            if XSHM_POOL_SIZE>0 and shm.get_ref_count()==0:
+                xshm_pool.put(shm_key(shm), shm)
+            else:
+                shm.cleanup()
+
     def do_get_property_contents_handle(self, name):
         if self._window is None:
             #shortcut out
@@ -970,6 +970,10 @@ cdef GdkFilterReturn x_event_filter(GdkXEvent * e_gdk,
                     pyev.width = e.xconfigure.width
                     pyev.height = e.xconfigure.height
                     pyev.border_width = e.xconfigure.border_width
+                    #same layout as X11Window.geometry_with_border:
+                    pyev.geometry = (e.xconfigure.x, e.xconfigure.y,
+                                     e.xconfigure.width, e.xconfigure.height,
+                                     e.xconfigure.border_width)
                 elif e.type == ReparentNotify:
                     debug("ReparentNotify event received")
                     pyev.window = _gw(d, e.xreparent.window)
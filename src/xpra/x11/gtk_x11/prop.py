@@ -352,13 +352,27 @@ def _prop_decode_list(disp, etype, data):
     #assert None not in props
     return [x for x in props if x is not None]
 
-# May return None.
-def prop_get(target, key, etype, ignore_errors=False, raise_xerrors=False):
+def _prop_atom(etype):
     if isinstance(etype, list):
         scalar_type = etype[0]
     else:
         scalar_type = etype
-    (_, atom, _, _, _, _) = _prop_types[scalar_type]
+    return _prop_types[scalar_type][1]
+
+def _prop_decode_value(target, key, etype, data, ignore_errors):
+    try:
+        return _prop_decode(target, etype, data)
+    except:
+        if not ignore_errors:
+            log.warn("Error parsing property %s (type %s); this may be a"
+                     + " misbehaving application, or bug in Xpra\n"
+                     + "  Data: %r[...?]",
+                     key, etype, data[:160], exc_info=True)
+        raise
+
+# May return None.
+def prop_get(target, key, etype, ignore_errors=False, raise_xerrors=False):
+    atom = _prop_atom(etype)
     try:
         data = trap.call_synced(X11Window.XGetWindowProperty, get_xwindow(target), key, atom)
     except NoSuchProperty:
@@ -373,12 +387,36 @@ def prop_get(target, key, etype, ignore_errors=False, raise_xerrors=False):
         if not ignore_errors:
             log.info("Missing property or wrong property type %s (%s)", key, etype, exc_info=True)
         return None
+    return _prop_decode_value(target, key, etype, data, ignore_errors)
+
+# Reads all the (key, etype) pairs given using a single error trap,
+# so we only need to sync with the server once rather than once per property.
+# Returns a dict of key -> value, where missing properties are None.
+def prop_get_many(target, specs, ignore_errors=False, raise_xerrors=False):
+    xwindow = get_xwindow(target)
+    def get_all():
+        raw = {}
+        for key, etype in specs:
+            try:
+                raw[key] = X11Window.XGetWindowProperty(xwindow, key, _prop_atom(etype))
+            except NoSuchProperty:
+                log.debug("Missing property %s (%s)", key, etype)
+            except PropertyError:
+                if not ignore_errors:
+                    log.info("Missing property or wrong property type %s (%s)", key, etype, exc_info=True)
+        return raw
     try:
-        return _prop_decode(target, etype, data)
-    except:
-        if not ignore_errors:
-            log.warn("Error parsing property %s (type %s); this may be a"
-                     + " misbehaving application, or bug in Xpra\n"
-                     + "  Data: %r[...?]",
-                     key, etype, data[:160], exc_info=True)
-        raise
+        raw = trap.call_synced(get_all)
+    except XError:
+        if raise_xerrors:
+            raise
+        log.info("Missing window %s or wrong property type for %s", target, specs, exc_info=True)
+        raw = {}
+    values = {}
+    for key, etype in specs:
+        data = raw.get(key)
+        if data is None:
+            values[key] = None
+        else:
+            values[key] = _prop_decode_value(target, key, etype, data, ignore_errors)
+    return values
@@ -9,19 +9,15 @@
 Most of the gunk required to be a valid window manager (reparenting, synthetic
 events, mucking about with properties, etc. etc.) is wrapped up in here."""
 
-# Maintain compatibility with old versions of Python, while avoiding a
-# deprecation warning on new versions:
-import sys
-if sys.version_info < (2, 6):
-    from sets import ImmutableSet
-else:
-    ImmutableSet = frozenset
 import gobject
 import gtk.gdk
-import cairo
 import os
+from array import array
+from weakref import WeakValueDictionary
+from collections import deque
 from socket import gethostname
 
+from xpra.util import AdHocStruct
 from xpra.x11.bindings.window_bindings import constants, X11WindowBindings #@UnresolvedImport
 X11Window = X11WindowBindings()
 
@@ -40,7 +36,7 @@ from xpra.gtk_common.gobject_util import (AutoPropGObjectMixin,
                            one_arg_signal,
                            non_none_list_accumulator)
 from xpra.x11.gtk_x11.error import trap, XError
-from xpra.x11.gtk_x11.prop import prop_get, prop_set
+from xpra.x11.gtk_x11.prop import prop_get, prop_get_many, prop_set
 from xpra.x11.gtk_x11.composite import CompositeHelper
 from xpra.x11.gtk_x11.pointer_grab import PointerGrabHelper
 
@@ -57,6 +53,61 @@ if gtk.pygtk_version<(2,17):
 MAX_WINDOW_SIZE = 2**15-1
 MAX_ASPECT = 2**15-1
 USE_XSHM = os.environ.get("XPRA_XSHM", "1")=="1"
+#only merge the damaged areas into their bounding box
+#when it does not add much to the area we have to repaint:
+DAMAGE_MERGE_RATIO = 1.25
+
+#the models for the client windows we have, by X11 window id:
+_models_by_xid = WeakValueDictionary()
+def get_model_for_xid(xid):
+    return _models_by_xid.get(xid)
+
+#gdk atoms we have already interned, by name:
+_gdk_atoms = {}
+def get_gdk_atom(name):
+    atom = _gdk_atoms.get(name)
+    if atom is None:
+        atom = gtk.gdk.atom_intern(name)
+        _gdk_atoms[name] = atom
+    return atom
+
+try:
+    _NUMBER_TYPES = (int, long, float)
+except NameError:
+    #python3: no 'long'
+    _NUMBER_TYPES = (int, float)
+
+#the WMSizeHints attributes that matter to us:
+_HINT_ATTRS = ("max_size", "min_size", "base_size", "resize_inc",
+               "min_aspect", "max_aspect", "min_aspect_ratio", "max_aspect_ratio",
+               "win_gravity")
+def _hints_sig(hints):
+    return tuple([getattr(hints, attr, None) for attr in _HINT_ATTRS])
+
+#corral windows we can re-use instead of creating new ones,
+#stored as (parking_window, corral_window) and already hidden under their parking window:
+CORRAL_POOL_SIZE = int(os.environ.get("XPRA_CORRAL_POOL_SIZE", "32"))
+_corral_pool = deque()
+def get_pooled_corral_window(parking_window):
+    for i, (parking, corral) in enumerate(_corral_pool):
+        if parking is parking_window:
+            del _corral_pool[i]
+            return corral
+    return None
+
+def pool_corral_window(parking_window, corral):
+    if len(_corral_pool)>=CORRAL_POOL_SIZE:
+        corral.destroy()
+        return
+    corral.hide()
+    corral.reparent(parking_window, 0, 0)
+    _corral_pool.append((parking_window, corral))
+
+def destroy_pooled_corral_windows():
+    #called when the window manager is torn down:
+    while _corral_pool:
+        _, corral = _corral_pool.popleft()
+        trap.swallow_synced(corral.destroy)
 
 
 # Todo:
@@ -276,22 +327,30 @@ class BaseWindowModel(AutoPropGObjectMixin, gobject.GObject):
         }
 
     def __init__(self, client_window):
-        log("new window %s - %s", hex(client_window.xid), hex(get_xwindow(client_window)))
         super(BaseWindowModel, self).__init__()
         self.client_window = client_window
+        #the X11 window id never changes, so we only look it up once:
+        self.xid = get_xwindow(client_window)
+        if log.is_debug_enabled():
+            log("new window %s - %s", hex(client_window.xid), hex(self.xid))
         self.client_window_saved_events = self.client_window.get_events()
         self._managed = False
-        self._managed_handlers = []
+        #signal handler ids are unsigned longs, store them compactly:
+        self._managed_handlers = array('L')
         self._setup_done = False
         self._input_field = True            # The WM_HINTS input field
         self._geometry = None
         self._damage_forward_handle = None
+        self._pending_damage = None
+        #property values read in advance, by (key, ptype), see preload_properties:
+        self._preloaded_props = None
         self._last_wm_state_serial = 0
         self._internal_set_property("client-window", client_window)
         use_xshm = USE_XSHM and (not self.is_OR() and not self.is_tray())
         self._composite = CompositeHelper(self.client_window, False, use_xshm)
         self._pointer_grab = PointerGrabHelper(self.client_window)
         self.property_names = ["pid", "transient-for", "fullscreen", "maximized", "window-type", "role", "group-leader", "xid", "has-alpha"]
+        _models_by_xid[self.xid] = self
 
     def get_property_names(self):
         return self.property_names
@@ -303,26 +362,36 @@ class BaseWindowModel(AutoPropGObjectMixin, gobject.GObject):
         return handler_id
 
     def managed_disconnect(self):
-        for handler_id in self._managed_handlers:
-            self.disconnect(handler_id)
+        #take the list first, so we never try to disconnect the same handler twice:
+        handlers, self._managed_handlers = self._managed_handlers, array('L')
+        disconnect = self.disconnect
+        for handler_id in handlers:
+            disconnect(handler_id)
 
     def call_setup(self):
-        log("call_setup()")
+        debug = log.is_debug_enabled()
+        if debug:
+            log("call_setup()")
         try:
-            self._geometry = trap.call_synced(X11Window.geometry_with_border, get_xwindow(self.client_window))
-        except XError, e:
+            #XGetGeometry waits for its reply, so any error has already been received
+            #and there is no need for an extra XSync:
+            self._geometry = trap.call_unsynced(X11Window.geometry_with_border, self.xid)
+        except XError as e:
             raise Unmanageable(e)
-        log("call_setup() adding event receiver")
+        if debug:
+            log("call_setup() adding event receiver")
         add_event_receiver(self.client_window, self)
         # Keith Packard says that composite state is undefined following a
         # reparent, so I'm not sure doing this here in the superclass,
         # before we reparent, actually works... let's wait and see.
-        log("call_setup() composite setup")
+        if debug:
+            log("call_setup() composite setup")
         try:
             trap.call_synced(self._composite.setup)
-        except XError, e:
+        except XError as e:
             remove_event_receiver(self.client_window, self)
-            log("window %s does not support compositing: %s", hex(get_xwindow(self.client_window)), e)
+            if debug:
+                log("window %s does not support compositing: %s", hex(self.xid), e)
             trap.swallow_synced(self._composite.destroy)
             self._composite = None
             raise Unmanageable(e)
@@ -330,20 +399,22 @@ class BaseWindowModel(AutoPropGObjectMixin, gobject.GObject):
         self._managed = True
         try:
             trap.call_synced(self.setup)
-        except XError, e:
+        except XError as e:
             try:
                 trap.call_synced(self.setup_failed, e)
-            except Exception, ex:
+            except Exception as ex:
                 log.error("error in cleanup handler: %s", ex)
             raise Unmanageable(e)
         self._pointer_grab.setup()
         self._pointer_grab.connect("grab", self.pointer_grab_event)
         self._pointer_grab.connect("ungrab", self.pointer_ungrab_event)
         self._setup_done = True
-        log("call_setup() ended, property_handlers=%s", self._property_handlers)
+        if debug:
+            log("call_setup() ended, property_handlers=%s", self._property_handlers)
 
     def setup_failed(self, e):
-        log("cannot manage %s: %s", hex(get_xwindow(self.client_window)), e)
+        if log.is_debug_enabled():
+            log("cannot manage %s: %s", hex(self.xid), e)
         self.do_unmanaged(False)
 
     def setup(self):
@@ -355,8 +426,34 @@ class BaseWindowModel(AutoPropGObjectMixin, gobject.GObject):
         # also allows us to ignore property errors during setup_client
         if not self._setup_done:
             ignore_errors = True
+            preloaded = self._preloaded_props
+            if preloaded and (key, ptype) in preloaded:
+                return preloaded[(key, ptype)]
         return prop_get(self.client_window, key, ptype, ignore_errors=ignore_errors, raise_xerrors=raise_xerrors)
 
+    def prop_get_many(self, specs, ignore_errors=False, raise_xerrors=False):
+        # Same as prop_get above, but for a list of (key, ptype) pairs,
+        # returns a dict of key -> value
+        if not self._setup_done:
+            ignore_errors = True
+        return prop_get_many(self.client_window, specs, ignore_errors=ignore_errors, raise_xerrors=raise_xerrors)
+
+    def preload_properties(self, specs):
+        # Reads the given (key, ptype) pairs in one go so that
+        # the property handlers called during setup can use them
+        # from prop_get instead of querying the server one at a time.
+        # Call clear_preloaded_properties() once the handlers have run.
+        try:
+            values = self.prop_get_many(specs, raise_xerrors=True)
+        except Exception as e:
+            #ie: a value we cannot parse, the handlers will read them again:
+            log("preload_properties(%s) failed: %s", specs, e)
+            return
+        self._preloaded_props = dict([((key, ptype), values[key]) for key, ptype in specs])
+
+    def clear_preloaded_properties(self):
+        self._preloaded_props = None
+
     def is_managed(self):
         return self._managed
 
@@ -365,8 +462,36 @@ class BaseWindowModel(AutoPropGObjectMixin, gobject.GObject):
 
 
     def _forward_contents_changed(self, obj, event):
-        if self._managed:
+        if not self._managed:
+            return
+        #accumulate the damage until the main loop is idle:
+        region = self._pending_damage
+        if region is None:
+            region = gtk.gdk.Region()
+            self._pending_damage = region
+            gobject.idle_add(self._flush_damage, priority=gobject.PRIORITY_HIGH_IDLE)
+        region.union_with_rect(gtk.gdk.Rectangle(event.x, event.y, event.width, event.height))
+
+    def _flush_damage(self):
+        region = self._pending_damage
+        self._pending_damage = None
+        if region is None or not self._managed:
+            return False
+        rects = region.get_rectangles()
+        if len(rects)>1:
+            #use a single event if the bounding box is not much bigger than the damaged areas:
+            bbox = region.get_clipbox()
+            area = sum([r.width*r.height for r in rects])
+            if bbox.width*bbox.height<=area*DAMAGE_MERGE_RATIO:
+                rects = [bbox]
+        for r in rects:
+            event = AdHocStruct()
+            event.x = r.x
+            event.y = r.y
+            event.width = r.width
+            event.height = r.height
             self.emit("client-contents-changed", event)
+        return False
 
     def acknowledge_changes(self):
         self._composite.acknowledge_changes()
@@ -377,31 +502,37 @@ class BaseWindowModel(AutoPropGObjectMixin, gobject.GObject):
 
     def do_xpra_property_notify_event(self, event):
         assert event.window is self.client_window
-        self._handle_property_change(str(event.atom))
+        #(the gdk bindings already give us the atom name as a string)
+        self._handle_property_change(event.atom)
 
     _property_handlers = {}
 
     def _handle_property_change(self, name):
         log("Property changed on %s: %s", self.client_window.xid, name)
-        if name in self._property_handlers:
-            self._property_handlers[name](self)
+        handler = self._property_handlers.get(name)
+        if handler is not None:
+            handler(self)
 
     def do_xpra_configure_event(self, event):
         if self.client_window is None or not self._managed:
             return
-        oldgeom = self._geometry
-        self._geometry = (event.x, event.y, event.width, event.height,
-                          event.border_width)
-        log("BaseWindowModel.do_xpra_configure_event(%s) old geometry=%s, new geometry=%s", event, oldgeom, self._geometry)
-        if oldgeom!=self._geometry:
-            self.notify("geometry")
+        geom = event.geometry
+        if geom==self._geometry:
+            #duplicate event (compositors often send those), nothing to do
+            return
+        log("BaseWindowModel.do_xpra_configure_event(%s) old geometry=%s, new geometry=%s", event, self._geometry, geom)
+        self._geometry = geom
+        self.geometry_changed()
+
+    def geometry_changed(self):
+        self.notify("geometry")
 
     def do_get_property_geometry(self, pspec):
         if self._geometry is None:
             def synced_update():
-                xwin = get_xwindow(self.client_window)
-                self._geometry = X11Window.geometry_with_border(xwin)
-                log("BaseWindowModel.synced_update() geometry(%s)=%s", hex(xwin), self._geometry)
+                self._geometry = X11Window.geometry_with_border(self.xid)
+                if log.is_debug_enabled():
+                    log("BaseWindowModel.synced_update() geometry(%s)=%s", hex(self.xid), self._geometry)
             try:
                 trap.call_unsynced(synced_update)
             except XError:
@@ -421,6 +552,8 @@ class BaseWindowModel(AutoPropGObjectMixin, gobject.GObject):
             return
         self._managed = False
         log("do_unmanaged(%s) damage_forward_handle=%s, composite=%s", wm_exiting, self._damage_forward_handle, self._composite)
+        if _models_by_xid.get(self.xid) is self:
+            del _models_by_xid[self.xid]
         remove_event_receiver(self.client_window, self)
         gobject.idle_add(self.managed_disconnect)
         if self._composite:
@@ -434,25 +567,36 @@ class BaseWindowModel(AutoPropGObjectMixin, gobject.GObject):
             self._pointer_grab = None
 
     def _read_initial_properties(self):
-        def pget(key, ptype, raise_xerrors=True):
-            return self.prop_get(key, ptype, raise_xerrors=raise_xerrors)
-        transient_for = pget("WM_TRANSIENT_FOR", "window")
+        #read all the properties we need in one go:
+        props = self.prop_get_many([("WM_TRANSIENT_FOR",     "window"),
+                                    ("_NET_WM_WINDOW_TYPE",  ["atom"]),
+                                    ("_NET_WM_PID",          "u32"),
+                                    ("WM_WINDOW_ROLE",       "latin1"),
+                                    ], raise_xerrors=True)
+        transient_for = props["WM_TRANSIENT_FOR"]
         # May be None
         self._internal_set_property("transient-for", transient_for)
 
-        window_types = pget("_NET_WM_WINDOW_TYPE", ["atom"])
+        window_types = props["_NET_WM_WINDOW_TYPE"]
         if not window_types:
-            window_type = self._guess_window_type(transient_for)
-            window_types = [gtk.gdk.atom_intern(window_type)]
+            if transient_for is not None:
+                window_type = self._TRANSIENT_WINDOW_TYPE
+            else:
+                window_type = self._DEFAULT_WINDOW_TYPE
+            window_types = [get_gdk_atom(window_type)]
         self._internal_set_property("window-type", window_types)
         self._handle_scaling()
         self._internal_set_property("has-alpha", self.client_window.get_depth()==32)
-        self._internal_set_property("xid", get_xwindow(self.client_window))
-        self._internal_set_property("pid", pget("_NET_WM_PID", "u32") or -1)
-        self._internal_set_property("role", pget("WM_WINDOW_ROLE", "latin1"))
+        self._internal_set_property("xid", self.xid)
+        self._internal_set_property("pid", props["_NET_WM_PID"] or -1)
+        self._internal_set_property("role", props["WM_WINDOW_ROLE"])
+        self.preload_properties([("_NET_WM_NAME",    "utf8"),
+                                 ("WM_NAME",         "latin1"),
+                                 ])
         for mutable in ["WM_NAME", "_NET_WM_NAME"]:
             log("reading initial value for %s", mutable)
             self._handle_property_change(mutable)
+        self.clear_preloaded_properties()
 
 
     def _handle_scaling(self):
@@ -499,14 +643,12 @@ class BaseWindowModel(AutoPropGObjectMixin, gobject.GObject):
 
     _property_handlers["WM_HINTS"] = _handle_wm_hints
 
-    def _guess_window_type(self, transient_for):
-        if transient_for is not None:
-            # EWMH says that even if it's transient-for, we MUST check to
-            # see if it's override-redirect (and if so treat as NORMAL).
-            # But we wouldn't be here if this was override-redirect.
-            # (OverrideRedirectWindowModel overrides this method)
-            return "_NET_WM_TYPE_DIALOG"
-        return "_NET_WM_WINDOW_TYPE_NORMAL"
+    # The window type we guess when the client does not specify one.
+    # EWMH says that even if it's transient-for, we MUST check to
+    # see if it's override-redirect (and if so treat as NORMAL).
+    # (OverrideRedirectWindowModel overrides these attributes)
+    _DEFAULT_WINDOW_TYPE = "_NET_WM_WINDOW_TYPE_NORMAL"
+    _TRANSIENT_WINDOW_TYPE = "_NET_WM_TYPE_DIALOG"
 
     def is_tray(self):
         return False
@@ -520,20 +662,20 @@ class BaseWindowModel(AutoPropGObjectMixin, gobject.GObject):
     def get_image(self, x, y, width, height, logger=log.debug):
         handle = self._composite.get_property("contents-handle")
         if handle is None:
-            logger("get_image(..) pixmap is None for window %s", hex(get_xwindow(self.client_window)))
+            logger("get_image(..) pixmap is None for window %s", hex(self.xid))
             return  None
 
-        #try XShm:
+        #try XShm, the image returned wraps the shared memory segment directly (no copy):
         try:
-            logger("get_image(%s, %s, %s, %s) geometry=%s", x, y, width, height, self._geometry[:4])
+            pixmap = handle.get_pixmap()
             shm = self._composite.get_property("shm-handle")
-            logger("get_image(..) XShm handle: %s, handle=%s, pixmap=%s", shm, handle, handle.get_pixmap())
+            logger("get_image(%s, %s, %s, %s) geometry=%s, XShm handle: %s, handle=%s, pixmap=%s", x, y, width, height, self._geometry, shm, handle, pixmap)
             if shm is not None:
-                shm_image = trap.call_synced(shm.get_image, handle.get_pixmap(), x, y, width, height)
+                shm_image = trap.call_synced(shm.get_image, pixmap, x, y, width, height)
                 logger("get_image(..) XShm image: %s", shm_image)
                 if shm_image:
                     return shm_image
-        except Exception, e:
+        except Exception as e:
             if type(e)==XError and e.msg=="BadMatch":
                 logger("get_image(%s, %s, %s, %s) get_image BadMatch ignored (window already gone?)", x, y, width, height)
             else:
@@ -545,7 +687,7 @@ class BaseWindowModel(AutoPropGObjectMixin, gobject.GObject):
             if w!=width or h!=height:
                 logger("get_image(%s, %s, %s, %s) clamped to pixmap dimensions: %sx%s", x, y, width, height, w, h)
             return trap.call_synced(handle.get_image, x, y, w, h)
-        except Exception, e:
+        except Exception as e:
             if type(e)==XError and e.msg=="BadMatch":
                 logger("get_image(%s, %s, %s, %s) get_image BadMatch ignored (window already gone?)", x, y, width, height)
             else:
@@ -617,6 +759,7 @@ class OverrideRedirectWindowModel(BaseWindowModel):
     def __init__(self, client_window):
         super(OverrideRedirectWindowModel, self).__init__(client_window)
         self.property_names.append("override-redirect")
+        self._geometry_notify_pending = False
 
     def call_setup(self):
         self._read_initial_properties()
@@ -630,7 +773,7 @@ class OverrideRedirectWindowModel(BaseWindowModel):
         # notice... but it might be unmapped already, and any event
         # already generated, and our request for that event is too late!
         # So double check now, *after* putting in our request:
-        if not X11Window.is_mapped(get_xwindow(self.client_window)):
+        if not X11Window.is_mapped(self.xid):
             raise Unmanageable("window already unmapped")
         ch = self._composite.get_property("contents-handle")
         if ch is None:
@@ -640,12 +783,25 @@ class OverrideRedirectWindowModel(BaseWindowModel):
         BaseWindowModel._read_initial_properties(self)
         self._internal_set_property("override-redirect", True)
 
-    def _guess_window_type(self, transient_for):
-        return "_NET_WM_WINDOW_TYPE_NORMAL"
+    _TRANSIENT_WINDOW_TYPE = "_NET_WM_WINDOW_TYPE_NORMAL"
 
     def do_xpra_unmap_event(self, event):
         self.unmanage()
 
+    def geometry_changed(self):
+        #override-redirect windows can be moved or resized in rapid bursts,
+        #(menus, tooltips, animations), so we only notify once per burst:
+        #(the geometry property is always up to date)
+        if not self._geometry_notify_pending:
+            self._geometry_notify_pending = True
+            gobject.idle_add(self._notify_geometry)
+
+    def _notify_geometry(self):
+        self._geometry_notify_pending = False
+        if self._managed:
+            self.notify("geometry")
+        return False
+
     def get_dimensions(self):
         ww, wh = self._geometry[2:4]
         return ww, wh
@@ -768,16 +924,36 @@ class WindowModel(BaseWindowModel):
         "xpra-xkb-event": one_arg_signal,
         }
 
-    def __init__(self, parking_window, client_window):
+    def __init__(self, parking_window, client_window, is_mapped=None):
         """Register a new client window with the WM.
 
         Raises an Unmanageable exception if this window should not be
         managed, for whatever reason.  ATM, this mostly means that the window
-        died somehow before we could do anything with it."""
+        died somehow before we could do anything with it.
+
+        If the caller already knows whether the window is mapped (ie: from
+        a MapRequest), it can tell us via is_mapped so we don't have to ask."""
 
         super(WindowModel, self).__init__(client_window)
         self.parking_window = parking_window
         self.corral_window = None
+        #the (x, y, w, h) we last configured the corral and client windows with:
+        self._last_configured = None
+        #we are the only ones resizing the corral window, so we track its size here
+        #rather than asking the server:
+        self._corral_size = None
+        #signature of the size hints we last received (see _hints_sig):
+        self._size_hints_sig = None
+        #the last size hints object we have sanitized:
+        self._sanitized_hints = None
+        #configure events come in bursts, we check the corral window once per burst:
+        self._resize_pending = False
+        self._pending_client_geometry = None
+        #the "state" we last wrote to _NET_WM_STATE:
+        self._written_state = None
+        #the "icon-pixmap", painted from the "icon" surface on demand:
+        self._icon_pixmap = None
+        self._initially_mapped = is_mapped
         self.in_save_set = False
         self.client_reparented = False
         self.startup_unmap_serial = None
@@ -789,18 +965,30 @@ class WindowModel(BaseWindowModel):
 
     def setup(self):
         BaseWindowModel.setup(self)
-
-        x, y, w, h, _ = self.client_window.get_geometry()
-        # We enable PROPERTY_CHANGE_MASK so that we can call
-        # x11_get_server_time on this window.
-        self.corral_window = gtk.gdk.Window(self.parking_window,
-                                            x = x, y = y, width =w, height= h,
-                                            window_type=gtk.gdk.WINDOW_CHILD,
-                                            wclass=gtk.gdk.INPUT_OUTPUT,
-                                            event_mask=gtk.gdk.PROPERTY_CHANGE_MASK,
-                                            title = "CorralWindow-0x%s" % self.client_window.xid)
-        log("setup() corral_window=%s", self.corral_window)
-        X11Window.substructureRedirect(get_xwindow(self.corral_window))
+        debug = log.is_debug_enabled()
+
+        #call_setup has just queried the geometry, re-use it:
+        x, y, w, h, _ = self._geometry
+        title = "CorralWindow-0x%s" % self.client_window.xid
+        corral = get_pooled_corral_window(self.parking_window)
+        if corral is not None:
+            #still has the event mask and substructure redirect from its last use:
+            corral.move_resize(x, y, w, h)
+            corral.set_title(title)
+            self.corral_window = corral
+        else:
+            # We enable PROPERTY_CHANGE_MASK so that we can call
+            # x11_get_server_time on this window.
+            self.corral_window = gtk.gdk.Window(self.parking_window,
+                                                x = x, y = y, width =w, height= h,
+                                                window_type=gtk.gdk.WINDOW_CHILD,
+                                                wclass=gtk.gdk.INPUT_OUTPUT,
+                                                event_mask=gtk.gdk.PROPERTY_CHANGE_MASK,
+                                                title = title)
+            X11Window.substructureRedirect(get_xwindow(self.corral_window))
+        self._corral_size = (w, h)
+        if debug:
+            log("setup() corral_window=%s (pooled=%s)", self.corral_window, corral is not None)
         add_event_receiver(self.corral_window, self)
 
         # Start listening for important events.
@@ -813,9 +1001,13 @@ class WindowModel(BaseWindowModel):
         # serial number of the request -- this way, when we get an
         # UnmapNotify later, we'll know that it's just from us unmapping
         # the window, not from the client withdrawing the window.
-        if X11Window.is_mapped(get_xwindow(self.client_window)):
-            log("hiding inherited window")
-            self.startup_unmap_serial = X11Window.Unmap(get_xwindow(self.client_window))
+        mapped = self._initially_mapped
+        if mapped is None:
+            mapped = X11Window.is_mapped(self.xid)
+        if mapped:
+            if debug:
+                log("hiding inherited window")
+            self.startup_unmap_serial = X11Window.Unmap(self.xid)
 
         # Process properties
         self._read_initial_properties()
@@ -824,27 +1016,32 @@ class WindowModel(BaseWindowModel):
         # For now, we never use the Iconic state at all.
         self._internal_set_property("iconic", False)
 
-        log("setup() adding to save set")
-        X11Window.XAddToSaveSet(get_xwindow(self.client_window))
+        if debug:
+            log("setup() adding to save set")
+        X11Window.XAddToSaveSet(self.xid)
         self.in_save_set = True
 
-        log("setup() reparenting")
+        if debug:
+            log("setup() reparenting")
         self.client_window.reparent(self.corral_window, 0, 0)
         self.client_reparented = True
 
-        log("setup() geometry")
-        w,h = self.client_window.get_geometry()[2:4]
+        #reparenting does not change the size,
+        #so we can use the geometry we got at the start instead of asking again:
         hints = self.get_property("size-hints")
         self._sanitize_size_hints(hints)
-        nw, nh = calc_constrained_size(w, h, hints)[:2]
+        nw, nh, _, _ = calc_constrained_size(w, h, hints)
         if nw>=MAX_WINDOW_SIZE or nh>=MAX_WINDOW_SIZE:
             #we can't handle windows that big!
             raise Unmanageable("window constrained size is too large: %sx%s (from client geometry: %s,%s with size hints=%s)" % (nw, nh, w, h, hints))
-        log("setup() resizing windows to %sx%s", nw, nh)
+        if debug:
+            log("setup() resizing windows to %sx%s", nw, nh)
         self.client_window.resize(nw, nh)
         self.corral_window.resize(nw, nh)
+        self._corral_size = (nw, nh)
         self.client_window.show_unraised()
-        self.client_window.get_geometry()
+        #no need to sync here: we are called via trap.call_synced
+        #which syncs once all the requests above have been sent
 
 
     def is_OR(self):
@@ -857,7 +1054,7 @@ class WindowModel(BaseWindowModel):
         return  self.get_property("actual-size")
 
     def do_xpra_xkb_event(self, event):
-        log("WindowModel.do_xpra_xkb_event(%r)" % event)
+        log("WindowModel.do_xpra_xkb_event(%r)", event)
         if event.type!="bell":
             log.error("WindowModel.do_xpra_xkb_event(%r) unknown event type: %s" % (event, event.type))
             return
@@ -911,25 +1108,39 @@ class WindowModel(BaseWindowModel):
         # the morning.  It makes for simple code:
         self.unmanage()
 
-    SCRUB_PROPERTIES = ["WM_STATE",
+    SCRUB_PROPERTIES = ("WM_STATE",
                         "_NET_WM_STATE",
                         "_NET_FRAME_EXTENTS",
                         "_NET_WM_ALLOWED_ACTIONS",
-                        ]
+                        )
+    #the X atoms for SCRUB_PROPERTIES, interned on first use:
+    _SCRUB_ATOMS = None
+
+    def _scrub_properties(self):
+        atoms = WindowModel._SCRUB_ATOMS
+        if atoms is None:
+            atoms = [X11Window.get_xatom(prop) for prop in WindowModel.SCRUB_PROPERTIES]
+            WindowModel._SCRUB_ATOMS = atoms
+        for atom in atoms:
+            X11Window.XDeleteProperty(self.xid, atom)
 
     def do_unmanaged(self, wm_exiting):
         log("unmanaging window: %s (%s - %s)", self, self.corral_window, self.client_window)
         self._internal_set_property("owner", None)
         if self.corral_window:
             remove_event_receiver(self.corral_window, self)
-            for prop in WindowModel.SCRUB_PROPERTIES:
-                trap.swallow_synced(X11Window.XDeleteProperty, get_xwindow(self.client_window), prop)
+            #send all the deletes and only sync once:
+            trap.swallow_synced(self._scrub_properties)
             if self.client_reparented:
                 self.client_window.reparent(gtk.gdk.get_default_root_window(), 0, 0)
                 self.client_reparented = False
             self.client_window.set_events(self.client_window_saved_events)
-            #it is now safe to destroy the corral window:
-            self.corral_window.destroy()
+            #it is now safe to get rid of the corral window,
+            #keep it for the next window unless we are exiting:
+            if wm_exiting:
+                self.corral_window.destroy()
+            else:
+                trap.swallow_synced(pool_corral_window, self.parking_window, self.corral_window)
             self.corral_window = None
             # It is important to remove from our save set, even after
             # reparenting, because according to the X spec, windows that are
@@ -938,9 +1149,9 @@ class WindowModel(BaseWindowModel):
             # section 10. Connection Close).  This causes "ghost windows", see
             # bug #27:
             if self.in_save_set:
-                trap.swallow_synced(X11Window.XRemoveFromSaveSet, get_xwindow(self.client_window))
+                trap.swallow_synced(X11Window.XRemoveFromSaveSet, self.xid)
                 self.in_save_set = False
-            trap.swallow_synced(X11Window.sendConfigureNotify, get_xwindow(self.client_window))
+            trap.swallow_synced(X11Window.sendConfigureNotify, self.xid)
             if wm_exiting:
                 self.client_window.show_unraised()
         BaseWindowModel.do_unmanaged(self, wm_exiting)
@@ -948,7 +1159,7 @@ class WindowModel(BaseWindowModel):
     def ownership_election(self):
         candidates = self.emit("ownership-election")
         if candidates:
-            rating, winner = sorted(candidates)[-1]
+            rating, winner = max(candidates)
             if rating < 0:
                 winner = None
         else:
@@ -959,12 +1170,17 @@ class WindowModel(BaseWindowModel):
         if old_owner is not None:
             self.corral_window.hide()
             self.corral_window.reparent(self.parking_window, 0, 0)
+        #reparenting moves the corral window:
+        self._last_configured = None
         self._internal_set_property("owner", winner)
         if winner is not None:
             winner.take_window(self, self.corral_window)
             self._update_client_geometry()
             self.corral_window.show_unraised()
-        trap.swallow_synced(X11Window.sendConfigureNotify, get_xwindow(self.client_window))
+        if self._last_configured is None:
+            #_update_client_geometry did not configure the client window
+            #(which would have notified it already), so tell it where it is now:
+            trap.swallow_synced(X11Window.sendConfigureNotify, self.xid)
 
     def maybe_recalculate_geometry_for(self, maybe_owner):
         if maybe_owner and self.get_property("owner") is maybe_owner:
@@ -973,25 +1189,24 @@ class WindowModel(BaseWindowModel):
     def _sanitize_size_hints(self, size_hints):
         if size_hints is None:
             return
-        for attr in ["min_aspect", "max_aspect"]:
+        #this modifies the hints in place, so we only need to do it once per hints object:
+        #(we keep a reference to it so the check cannot match a new object at the same address)
+        if size_hints is self._sanitized_hints:
+            return
+        self._sanitized_hints = size_hints
+        for attr in ("min_aspect", "max_aspect"):
             v = getattr(size_hints, attr)
             if v is not None:
-                try:
-                    f = float(v)
-                except:
-                    f = None
-                if f is None or f>=MAX_ASPECT:
+                #(v==v is False for NaN)
+                if not isinstance(v, _NUMBER_TYPES) or v!=v or v>=MAX_ASPECT:
                     log.warn("clearing invalid aspect hint value for %s: %s", attr, v)
                     setattr(size_hints, attr, -1.0)
-        for attr in ["max_size", "min_size", "base_size", "resize_inc",
-                     "min_aspect_ratio", "max_aspect_ratio"]:
+        for attr in ("max_size", "min_size", "base_size", "resize_inc",
+                     "min_aspect_ratio", "max_aspect_ratio"):
             v = getattr(size_hints, attr)
             if v is not None:
-                try:
-                    w,h = v
-                except:
-                    w,h = None,None
-                if (w is None or h is None) or w>=MAX_WINDOW_SIZE or h>=MAX_WINDOW_SIZE:
+                if not isinstance(v, (tuple, list)) or len(v)!=2 \
+                    or v[0] is None or v[1] is None or v[0]>=MAX_WINDOW_SIZE or v[1]>=MAX_WINDOW_SIZE:
                     log("clearing invalid size hint value for %s: %s", attr, v)
                     setattr(size_hints, attr, None)
         #if max-size is smaller than min-size (bogus), clamp it..
@@ -1009,23 +1224,18 @@ class WindowModel(BaseWindowModel):
         owner = self.get_property("owner")
         if owner is not None:
             log("_update_client_geometry: owner()=%s", owner)
-            def window_size():
-                return  owner.window_size(self)
-            def window_position(w, h):
-                return  owner.window_position(self, w, h)
-            self._do_update_client_geometry(window_size, window_position)
+            allocated_w, allocated_h = owner.window_size(self)
+            self._do_update_client_geometry(allocated_w, allocated_h, owner)
         elif not self._setup_done:
-            log("_update_client_geometry: using initial size=%s and position=%s",
-                self.get_property("requested-size"), self.get_property("requested-position"))
             #try to honour initial size and position requests during setup:
-            def window_size():
-                return self.get_property("requested-size")
-            def window_position(w, h):
-                return self.get_property("requested-position")
-            self._do_update_client_geometry(window_size, window_position)
-
-    def _do_update_client_geometry(self, window_size_cb, window_position_cb):
-        allocated_w, allocated_h = window_size_cb()
+            allocated_w, allocated_h = self.get_property("requested-size")
+            log("_update_client_geometry: using initial size=%s and position=%s",
+                (allocated_w, allocated_h), self.get_property("requested-position"))
+            self._do_update_client_geometry(allocated_w, allocated_h, None)
+
+    def _do_update_client_geometry(self, allocated_w, allocated_h, owner):
+        # the owner decides where the window goes,
+        # without one we use the position the client requested
         log("_do_update_client_geometry: %sx%s", allocated_w, allocated_h)
         hints = self.get_property("size-hints")
         log("_do_update_client_geometry: hints=%s", hints)
@@ -1034,12 +1244,32 @@ class WindowModel(BaseWindowModel):
         size = calc_constrained_size(allocated_w, allocated_h, hints)
         log("_do_update_client_geometry: size=%s", size)
         w, h, wvis, hvis = size
-        x, y = window_position_cb(w, h)
+        if owner is not None:
+            x, y = owner.window_position(self, w, h)
+        else:
+            x, y = self.get_property("requested-position")
         log("_do_update_client_geometry: position=%s", (x,y))
-        self.corral_window.move_resize(x, y, w, h)
-        trap.swallow_synced(X11Window.configureAndNotify, get_xwindow(self.client_window), 0, 0, w, h)
-        self._internal_set_property("actual-size", (w, h))
-        self._internal_set_property("user-friendly-size", (wvis, hvis))
+        geometry = (x, y, w, h)
+        if geometry!=self._last_configured:
+            self.corral_window.move_resize(x, y, w, h)
+            self._corral_size = (w, h)
+            trap.swallow_synced(X11Window.configureAndNotify, self.xid, 0, 0, w, h)
+            self._last_configured = geometry
+        self._set_sizes(w, h, wvis, hvis)
+
+    def _set_sizes(self, w, h, wvis, hvis):
+        #only update (and notify) the sizes that have changed,
+        #and dispatch the notifications together:
+        actual_size = (w, h)
+        user_friendly_size = (wvis, hvis)
+        self.freeze_notify()
+        try:
+            if self.get_property("actual-size")!=actual_size:
+                self._internal_set_property("actual-size", actual_size)
+            if self.get_property("user-friendly-size")!=user_friendly_size:
+                self._internal_set_property("user-friendly-size", user_friendly_size)
+        finally:
+            self.thaw_notify()
 
     def do_xpra_configure_event(self, event):
         log("WindowModel.do_xpra_configure_event(%s)", event)
@@ -1050,18 +1280,36 @@ class WindowModel(BaseWindowModel):
             return
         if self.client_window is None or not self.client_window.is_visible():
             return
+        if event.window is self.client_window:
+            #the event already tells us where the client window is:
+            self._pending_client_geometry = event.geometry[:4]
+        if not self._resize_pending:
+            self._resize_pending = True
+            gobject.idle_add(self._drain_resize)
+
+    def _drain_resize(self):
+        self._resize_pending = False
+        client_geometry = self._pending_client_geometry
+        self._pending_client_geometry = None
+        if not self._managed or self.corral_window is None or not self.corral_window.is_visible():
+            return False
+        if self.client_window is None or not self.client_window.is_visible():
+            return False
         try:
             #workaround applications whose windows disappear from underneath us:
-            if trap.call_synced(self.resize_corral_window):
+            if trap.call_synced(self.resize_corral_window, client_geometry):
                 self.notify("geometry")
-        except XError, e:
+        except XError as e:
             log.warn("failed to resize corral window: %s", e)
+        return False
 
-    def resize_corral_window(self):
+    def resize_corral_window(self, client_geometry=None):
         #the client window may have been resized (generally programmatically)
         #so we may need to update the corral_window to match
-        cow, coh = self.corral_window.get_geometry()[2:4]
-        clx, cly, clw, clh = self.client_window.get_geometry()[:4]
+        cow, coh = self._corral_size
+        if client_geometry is None:
+            client_geometry = self.client_window.get_geometry()[:4]
+        clx, cly, clw, clh = client_geometry
         if (clx, cly) != (0, 0):
             log("resize_corral_window() client window has moved, resetting it")
             self.client_window.move(0, 0)
@@ -1069,13 +1317,14 @@ class WindowModel(BaseWindowModel):
             log("resize_corral_window() corral window (%sx%s) does not match client window (%sx%s), resizing it",
                      cow, coh, clw, clh)
             self.corral_window.resize(clw, clh)
+            self._corral_size = (clw, clh)
+            self._last_configured = None
             hints = self.get_property("size-hints")
             self._sanitize_size_hints(hints)
             size = calc_constrained_size(clw, clh, hints)
             log("resize_corral_window() new constrained size=%s", size)
             w, h, wvis, hvis = size
-            self._internal_set_property("actual-size", (w, h))
-            self._internal_set_property("user-friendly-size", (wvis, hvis))
+            self._set_sizes(w, h, wvis, hvis)
             return True
         return False
 
@@ -1083,21 +1332,30 @@ class WindowModel(BaseWindowModel):
         # Ignore the request, but as per ICCCM 4.1.5, send back a synthetic
         # ConfigureNotify telling the client that nothing has happened.
         log("do_child_configure_request_event(%s)", event)
-        trap.swallow_synced(X11Window.sendConfigureNotify, get_xwindow(event.window))
+        if event.window is self.client_window:
+            xid = self.xid
+        else:
+            xid = get_xwindow(event.window)
+        trap.swallow_synced(X11Window.sendConfigureNotify, xid)
 
         # Also potentially update our record of what the app has requested:
-        (x, y) = self.get_property("requested-position")
+        old_position = self.get_property("requested-position")
+        (x, y) = old_position
         if event.value_mask & constants["CWX"]:
             x = event.x
         if event.value_mask & constants["CWY"]:
             y = event.y
-        self._internal_set_property("requested-position", (x, y))
 
-        (w, h) = self.get_property("requested-size")
+        old_size = self.get_property("requested-size")
+        (w, h) = old_size
         if event.value_mask & constants["CWWidth"]:
             w = event.width
         if event.value_mask & constants["CWHeight"]:
             h = event.height
+        if (x, y)==old_position and (w, h)==old_size:
+            #nothing new, the synthetic ConfigureNotify above is all the client needs:
+            return
+        self._internal_set_property("requested-position", (x, y))
         self._internal_set_property("requested-size", (w, h))
         self._update_client_geometry()
 
@@ -1113,8 +1371,13 @@ class WindowModel(BaseWindowModel):
         # gets no-op updated -- some apps like FSF Emacs 21 like to update
         # their properties every time they see a ConfigureNotify, and this
         # reduces the chance for us to get caught in loops:
-        old_hints = self.get_property("size-hints")
-        if size_hints and (old_hints is None or size_hints.__dict__ != old_hints.__dict__):
+        # (we compare signatures rather than the objects because the hints
+        # we store get modified by _sanitize_size_hints)
+        if not size_hints:
+            return
+        sig = _hints_sig(size_hints)
+        if sig!=self._size_hints_sig:
+            self._size_hints_sig = sig
             self._internal_set_property("size-hints", size_hints)
             self._update_client_geometry()
 
@@ -1147,32 +1410,44 @@ class WindowModel(BaseWindowModel):
     def _handle_net_wm_icon(self):
         log("_NET_WM_ICON changed on %s, re-reading", self.client_window.xid)
         surf = self.prop_get("_NET_WM_ICON", "icon")
-        if surf is not None:
-            # FIXME: There is no Pixmap.new_for_display(), so this isn't
-            # actually display-clean.  Oh well.
-            pixmap = gtk.gdk.Pixmap(None,
-                                    surf.get_width(), surf.get_height(), 32)
-            screen = get_display_for(pixmap).get_default_screen()
-            pixmap.set_colormap(screen.get_rgba_colormap())
-            cr = pixmap.cairo_create()
-            cr.set_source_surface(surf)
-            # Important to use SOURCE, because a newly created Pixmap can have
-            # random trash as its contents, and otherwise that will show
-            # through any alpha in the icon:
-            cr.set_operator(cairo.OPERATOR_SOURCE)
-            cr.paint()
-        else:
-            pixmap = None
         self._internal_set_property("icon", surf)
-        self._internal_set_property("icon-pixmap", pixmap)
-        log("icon is now %r", self.get_property("icon"))
+        #the pixmap is only painted if someone asks for it:
+        self._icon_pixmap = None
+        self.notify("icon-pixmap")
+        log("icon is now %r", surf)
     _property_handlers["_NET_WM_ICON"] = _handle_net_wm_icon
 
+    def do_get_property_icon_pixmap(self, name):
+        if self._icon_pixmap is not None:
+            return self._icon_pixmap
+        surf = self.get_property("icon")
+        if surf is None:
+            return None
+        # FIXME: There is no Pixmap.new_for_display(), so this isn't
+        # actually display-clean.  Oh well.
+        pixmap = gtk.gdk.Pixmap(None,
+                                surf.get_width(), surf.get_height(), 32)
+        screen = get_display_for(pixmap).get_default_screen()
+        pixmap.set_colormap(screen.get_rgba_colormap())
+        import cairo
+        cr = pixmap.cairo_create()
+        cr.set_source_surface(surf)
+        # Important to use SOURCE, because a newly created Pixmap can have
+        # random trash as its contents, and otherwise that will show
+        # through any alpha in the icon:
+        cr.set_operator(cairo.OPERATOR_SOURCE)
+        cr.paint()
+        self._icon_pixmap = pixmap
+        return pixmap
+
     def _read_initial_properties(self):
         # Things that don't change:
         BaseWindowModel._read_initial_properties(self)
-        def pget(key, ptype):
-            return self.prop_get(key, ptype, raise_xerrors=True)
+        props = self.prop_get_many([("WM_CLASS",             "latin1"),
+                                    ("WM_PROTOCOLS",         ["atom"]),
+                                    ("WM_CLIENT_MACHINE",    "latin1"),
+                                    ("_NET_WM_STATE",        ["atom"]),
+                                    ], raise_xerrors=True)
 
         geometry = self.client_window.get_geometry()
         self._internal_set_property("requested-position", (geometry[0], geometry[1]))
@@ -1189,18 +1464,18 @@ class WindowModel(BaseWindowModel):
             except ValueError:
                 log.warn("Malformed WM_CLASS: %s, ignoring", class_instance)
                 return  False
-        class_instance = pget("WM_CLASS", "latin1")
+        class_instance = props["WM_CLASS"]
         if class_instance:
             if not set_class_instance(class_instance):
-                set_class_instance(pget("WM_CLASS", "utf8"))
+                set_class_instance(self.prop_get("WM_CLASS", "utf8", raise_xerrors=True))
 
-        protocols = pget("WM_PROTOCOLS", ["atom"])
+        protocols = props["WM_PROTOCOLS"]
         if protocols is None:
             protocols = []
         self._internal_set_property("protocols", protocols)
         self.notify("can-focus")
 
-        client_machine = pget("WM_CLIENT_MACHINE", "latin1")
+        client_machine = props["WM_CLIENT_MACHINE"]
         # May be None
         self._internal_set_property("client-machine", client_machine)
 
@@ -1219,19 +1494,27 @@ class WindowModel(BaseWindowModel):
         # initial states are read off from the client, and (2) is accomplished
         # by having WM_HINTS affect _NET_WM_STATE.  But this means that
         # WM_HINTS and _NET_WM_STATE handling become intertangled.
-        net_wm_state = pget("_NET_WM_STATE", ["atom"])
+        net_wm_state = props["_NET_WM_STATE"]
         if net_wm_state:
-            self._internal_set_property("state", ImmutableSet(net_wm_state))
+            self._internal_set_property("state", frozenset(net_wm_state))
         else:
-            self._internal_set_property("state", ImmutableSet())
+            self._internal_set_property("state", frozenset())
         modal = (net_wm_state is not None) and ("_NET_WM_STATE_MODAL" in net_wm_state)
         self._internal_set_property("modal", modal)
 
+        self.preload_properties([("WM_HINTS",               "wm-hints"),
+                                 ("WM_NORMAL_HINTS",        "wm-size-hints"),
+                                 ("_NET_WM_ICON_NAME",      "utf8"),
+                                 ("WM_ICON_NAME",           "latin1"),
+                                 ("_NET_WM_STRUT_PARTIAL",  "strut-partial"),
+                                 ("_NET_WM_STRUT",          "strut"),
+                                 ])
         for mutable in ["WM_HINTS", "WM_NORMAL_HINTS",
                         "WM_ICON_NAME", "_NET_WM_ICON_NAME",
                         "_NET_WM_STRUT", "_NET_WM_STRUT_PARTIAL"]:
             log("reading initial value for %s", mutable)
             self._handle_property_change(mutable)
+        self.clear_preloaded_properties()
         for mutable in ["_NET_WM_ICON"]:
             try:
                 self._handle_property_change(mutable)
@@ -1263,53 +1546,58 @@ class WindowModel(BaseWindowModel):
         "fullscreen": "_NET_WM_STATE_FULLSCREEN",
         }
 
-    _state_properties_reversed = {}
-    for k, v in _state_properties.iteritems():
-        _state_properties_reversed[v] = k
+    _state_properties_reversed = dict((v, k) for k, v in _state_properties.items())
 
     def _state_add(self, state_name):
-        curr = set(self.get_property("state"))
-        if state_name not in curr:
-            curr.add(state_name)
-            self._internal_set_property("state", ImmutableSet(curr))
-            if state_name in self._state_properties_reversed:
-                self.notify(self._state_properties_reversed[state_name])
+        curr = self.get_property("state")
+        if state_name in curr:
+            return
+        self._internal_set_property("state", curr.union((state_name,)))
+        prop = self._state_properties_reversed.get(state_name)
+        if prop is not None:
+            self.notify(prop)
 
     def _state_remove(self, state_name):
-        curr = set(self.get_property("state"))
-        if state_name in curr:
-            curr.discard(state_name)
-            self._internal_set_property("state", ImmutableSet(curr))
-            if state_name in self._state_properties_reversed:
-                self.notify(self._state_properties_reversed[state_name])
+        curr = self.get_property("state")
+        if state_name not in curr:
+            return
+        self._internal_set_property("state", curr.difference((state_name,)))
+        prop = self._state_properties_reversed.get(state_name)
+        if prop is not None:
+            self.notify(prop)
 
     def _state_isset(self, state_name):
         return state_name in self.get_property("state")
 
     def _handle_state_changed(self, *args):
-        # Sync changes to "state" property out to X property.
-        trap.swallow_synced(prop_set, self.client_window, "_NET_WM_STATE",
-                 ["atom"], self.get_property("state"))
+        # Sync changes to "state" property out to X property,
+        # unless this is the state we have already written:
+        state = self.get_property("state")
+        if state==self._written_state:
+            return
+        if trap.swallow_synced(prop_set, self.client_window, "_NET_WM_STATE",
+                 ["atom"], state):
+            #only remember it once the write has succeeded:
+            self._written_state = state
 
     def do_set_property(self, pspec, value):
-        if pspec.name in self._state_properties:
-            state = self._state_properties[pspec.name]
-            if value:
-                self._state_add(state)
-            else:
-                self._state_remove(state)
-        else:
+        state = self._state_properties.get(pspec.name)
+        if state is None:
             AutoPropGObjectMixin.do_set_property(self, pspec, value)
+        elif value:
+            self._state_add(state)
+        else:
+            self._state_remove(state)
 
     def do_get_property_can_focus(self, name):
         assert name == "can-focus"
         return bool(self._input_field) or "WM_TAKE_FOCUS" in self.get_property("protocols")
 
     def do_get_property(self, pspec):
-        if pspec.name in self._state_properties:
-            return self._state_isset(self._state_properties[pspec.name])
-        else:
+        state = self._state_properties.get(pspec.name)
+        if state is None:
             return AutoPropGObjectMixin.do_get_property(self, pspec)
+        return self._state_isset(state)
 
 
     def _handle_iconic_update(self, *args):
@@ -1349,6 +1637,11 @@ class WindowModel(BaseWindowModel):
 
     def do_give_client_focus(self):
         log("Giving focus to client")
+        use_input_focus = bool(self._input_field)
+        use_take_focus = "WM_TAKE_FOCUS" in self.get_property("protocols")
+        if not use_input_focus and not use_take_focus:
+            log("... the window does not accept focus")
+            return
         # Have to fetch the time, not just use CurrentTime, both because ICCCM
         # says that WM_TAKE_FOCUS must use a real time and because there are
         # genuine race conditions here (e.g. suppose the client does not
@@ -1368,10 +1661,10 @@ class WindowModel(BaseWindowModel):
         # XSetInputFocus well, while Qt apps ignore (!!!) WM_TAKE_FOCUS
         # (unless they have a modal window), and just expect to get focus from
         # the WM's XSetInputFocus.
-        if bool(self._input_field):
+        if use_input_focus:
             log("... using XSetInputFocus")
-            X11Window.XSetInputFocus(get_xwindow(self.client_window), now)
-        if "WM_TAKE_FOCUS" in self.get_property("protocols"):
+            X11Window.XSetInputFocus(self.xid, now)
+        if use_take_focus:
             log("... using WM_TAKE_FOCUS")
             send_wm_take_focus(self.client_window, now)
 
@@ -1401,7 +1694,7 @@ class WindowModel(BaseWindowModel):
                     os.kill(pid, 9)
                 except OSError:
                     log.warn("failed to kill() client with pid %s", pid)
-        trap.swallow_synced(X11Window.XKillClient, get_xwindow(self.client_window))
+        trap.swallow_synced(X11Window.XKillClient, self.xid)
 
     def __repr__(self):
         return "WindowModel(%s)" % self.client_window
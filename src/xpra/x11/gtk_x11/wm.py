@@ -7,21 +7,13 @@
 import gtk
 import gobject
 
-# Maintain compatibility with old versions of Python, while avoiding a
-# deprecation warning on new versions:
-import sys
-if sys.version_info < (2, 6):
-    from sets import ImmutableSet
-else:
-    ImmutableSet = frozenset
-
 from xpra.x11.gtk_x11.error import trap
 import xpra.x11.gtk_x11.selection
 from xpra.x11.gtk_x11.world_window import WorldWindow
 from xpra.x11.gtk_x11.prop import prop_set, prop_get
 from xpra.gtk_common.gobject_util import no_arg_signal, one_arg_signal
 
-from xpra.x11.gtk_x11.window import WindowModel, Unmanageable
+from xpra.x11.gtk_x11.window import WindowModel, Unmanageable, destroy_pooled_corral_windows
 from xpra.x11.gtk_x11.gdk_bindings import (
                add_event_receiver,                          #@UnresolvedImport
                get_children,                                #@UnresolvedImport
@@ -279,7 +271,7 @@ class Wm(gobject.GObject):
 
     def do_get_property(self, pspec):
         if pspec.name == "windows":
-            return ImmutableSet(self._windows.itervalues())
+            return frozenset(self._windows.itervalues())
         elif pspec.name == "toplevel":
             return self._world_window
         else:
@@ -287,16 +279,16 @@ class Wm(gobject.GObject):
 
     # This is in some sense the key entry point to the entire WM program.  We
     # have detected a new client window, and start managing it:
-    def _manage_client(self, gdkwindow):
+    def _manage_client(self, gdkwindow, is_mapped=None):
         try:
             if gdkwindow not in self._windows:
-                trap.call_synced(self.do_manage_client, gdkwindow)
+                trap.call_synced(self.do_manage_client, gdkwindow, is_mapped)
         except Exception, e:
             log("failed to manage client %s: %s", gdkwindow, e)
 
-    def do_manage_client(self, gdkwindow):
+    def do_manage_client(self, gdkwindow, is_mapped=None):
         try:
-            win = WindowModel(self._root, gdkwindow)
+            win = WindowModel(self._root, gdkwindow, is_mapped)
         except Unmanageable:
             log("Window disappeared on us, never mind")
             return
@@ -351,10 +343,12 @@ class Wm(gobject.GObject):
     def do_quit(self):
         for win in list(self._windows.itervalues()):
             win.unmanage(True)
+        destroy_pooled_corral_windows()
 
     def do_child_map_request_event(self, event):
         log("Found a potential client")
-        self._manage_client(event.window)
+        #the map request was redirected to us, so the window is not mapped yet:
+        self._manage_client(event.window, False)
 
     def do_child_configure_request_event(self, event):
         # The point of this method is to handle configure requests on
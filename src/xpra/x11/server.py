@@ -17,6 +17,7 @@ import gobject
 from xpra.util import AdHocStruct
 from xpra.gtk_common.gobject_util import one_arg_signal
 from xpra.x11.gtk_x11.wm import Wm
+from xpra.x11.gtk_x11.composite import xshm_pool
 from xpra.x11.gtk_x11.tray import get_tray_window, SystemTray
 from xpra.x11.gtk_x11.gdk_bindings import (get_xwindow,                 #@UnresolvedImport
                                add_event_receiver,          #@UnresolvedImport
@@ -27,7 +28,7 @@ from xpra.x11.bindings.window_bindings import X11WindowBindings #@UnresolvedImpo
 X11Window = X11WindowBindings()
 from xpra.x11.bindings.keyboard_bindings import X11KeyboardBindings #@UnresolvedImport
 X11Keyboard = X11KeyboardBindings()
-from xpra.x11.gtk_x11.window import OverrideRedirectWindowModel, SystemTrayWindowModel, Unmanageable
+from xpra.x11.gtk_x11.window import OverrideRedirectWindowModel, SystemTrayWindowModel, Unmanageable, get_model_for_xid, destroy_pooled_corral_windows
 from xpra.x11.gtk_x11.error import trap
 
 from xpra.log import Logger
@@ -122,12 +123,11 @@ class DesktopManager(gtk.Widget):
             return None
         log("found transient_for=%s, xid=%s", transient_for, hex(transient_for.xid))
         #try to find the model for this window:
-        for model in self._models.keys():
-            log("testing model %s: %s", model, hex(model.client_window.xid))
-            if model.client_window.xid==transient_for.xid:
-                wid = window_to_id.get(model)
-                log("found match, window id=%s", wid)
-                return wid
+        model = get_model_for_xid(transient_for.xid)
+        if model is not None and model in self._models:
+            wid = window_to_id.get(model)
+            log("found match %s, window id=%s", model, wid)
+            return wid
         root = gtk.gdk.get_default_root_window()
         if root.xid==transient_for.xid:
             return -1       #-1 is the backwards compatible marker for root...
@@ -241,6 +241,8 @@ class XpraServer(gobject.GObject, X11ServerBase):
         if self._tray:
             self._tray.cleanup()
             self._tray = None
+        destroy_pooled_corral_windows()
+        xshm_pool.cleanup()
         X11ServerBase.cleanup(self)
 
     def load_existing_windows(self, system_tray):